@@ -0,0 +1,562 @@
+"""
+負荷試験
+Discordへ接続せず、疑似オブジェクトと疑似音声合成バックエンドを使用して、
+複数サーバーへの投稿から再生開始までの遅延・処理量・メモリ使用量を計測する
+
+使用例: python loadtest.py config.yml --guilds 50 --messages 20 --interval 0.5 --latency 0.2
+
+--wavに音声合成済みのWAVファイルを指定すると、負荷試験の代わりに音声後処理の効果を計測する
+使用例: python loadtest.py config.yml --wav sample1.wav sample2.wav --voice mn
+
+--benchmarkを指定すると、負荷試験の代わりに個別の処理の性能を計測する
+使用例: python loadtest.py config.yml --benchmark encode --wav sample1.wav sample2.wav
+"""
+import argparse
+import asyncio
+import ctypes.util
+import logging
+import os
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+import main
+
+
+class FakeAuthor:
+    """ 疑似ユーザー
+    """
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f'user{user_id}'
+        self.bot = False
+
+
+class FakeChannel:
+    """ 疑似チャンネル
+    """
+
+    def __init__(self, channel_id: int, guild):
+        self.id = channel_id
+        self.name = f'channel{channel_id}'
+        self.guild = guild
+
+    async def send(self, *args, **kwargs) -> None:
+        pass
+
+
+class FakeGuild:
+    """ 疑似サーバー
+    """
+
+    def __init__(self, guild_id: int, voice_client):
+        self.id = guild_id
+        self.voice_client = voice_client
+
+
+class FakeMessage:
+    """ 疑似メッセージ
+    """
+
+    def __init__(self, guild: FakeGuild, channel: FakeChannel, author: FakeAuthor, content: str):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+
+
+class StubVoiceClient:
+    """ 疑似ボイスクライアント
+    音声を送信せず、フレーム数×20msの再生時間だけ待機してから再生終了コールバックを呼び出す
+    再生開始時に、再生した音声の元になった投稿の遅延を記録する
+    """
+
+    def __init__(self, harness):
+        self.harness = harness
+        self.handle: asyncio.TimerHandle = None
+        self.after = None
+
+    def play(self, source, after) -> None:
+        self.harness.on_play(source.audio)
+        frames = 0
+        while source.read():
+            frames += 1
+        self.after = after
+        self.handle = asyncio.get_running_loop().call_later(frames * 0.02, self.finish)
+
+    def finish(self) -> None:
+        self.handle = None
+        self.after(None)
+
+    def is_playing(self) -> bool:
+        return self.handle is not None
+
+    def stop(self) -> None:
+        if self.handle:
+            self.handle.cancel()
+            self.finish()
+
+
+class TaggingBackend(main.FakeSynthesisBackend):
+    """ 遅延計測用疑似音声合成バックエンド
+    生成した音声と元の文字列を対応付けて記録する
+    """
+
+    def __init__(self, latency: float, tags: dict[int, str]):
+        super().__init__(latency)
+        self.tags = tags
+
+    async def render(self, source: main.VoiceSource) -> main.EncodedAudio:
+        # 同じ文字列でも別の音声として記録できるよう、毎回新しいインスタンスを返す
+        audio = main.EncodedAudio(tuple((await super().render(source)).frames))
+        self.tags[id(audio)] = source.text
+        return audio
+
+
+class Harness:
+    """ 負荷試験実行クラス
+    """
+
+    def __init__(self, guilds: int, messages: int, interval: float):
+        """ 初期化処理
+
+        :param guilds: サーバー数
+        :param messages: サーバーごとの投稿数
+        :param interval: 同一サーバー内の投稿間隔(秒)
+        """
+        self.guilds = guilds
+        self.messages = messages
+        self.interval = interval
+        self.tags: dict[int, str] = {}
+        self.sent: dict[str, float] = {}
+        self.latencies: list[float] = []
+        self.done = asyncio.Event()
+
+    def on_play(self, audio: main.EncodedAudio) -> None:
+        """ 再生開始記録
+        まとめて読み上げられた投稿は、それぞれの投稿の遅延として記録する
+
+        :param audio: 再生する音声
+        :return: None
+        """
+        now = time.perf_counter()
+        for text in self.tags.pop(id(audio), '').split(main.COALESCE_SEPARATOR):
+            if text in self.sent:
+                self.latencies.append(now - self.sent.pop(text))
+        if not self.sent:
+            self.done.set()
+
+    async def post(self, guild: FakeGuild, channel: FakeChannel) -> None:
+        """ 投稿
+        1サーバー分の投稿を一定間隔で行う
+
+        :param guild: サーバー
+        :param channel: テキストチャンネル
+        :return: None
+        """
+        for number in range(self.messages):
+            text = f'{guild.id}-{number}'
+            self.sent[text] = time.perf_counter()
+            await main.enqueue_message(FakeMessage(guild, channel, FakeAuthor(number % 5), text))
+            await asyncio.sleep(self.interval)
+
+    def dropped(self) -> int:
+        """ 破棄件数
+
+        :return: 溢れ・期限切れで破棄された投稿数
+        """
+        return sum(status.voice_que.dropped + status.expired for status in main.app.server_statuses.values())
+
+    async def run(self, timeout: float) -> None:
+        """ 実行
+
+        :param timeout: 全投稿の再生を待つ上限時間(秒)
+        :return: None
+        """
+        for guild_id in range(1, self.guilds + 1):
+            guild = FakeGuild(guild_id, StubVoiceClient(self))
+            channel = FakeChannel(guild_id, guild)
+            status = main.YomiageStatus(id=guild_id, voice_channel=channel)
+            status.watch(channel)
+            status.task = asyncio.ensure_future(status.voice_play_task())
+            main.app.server_statuses[guild_id] = status
+            main.app.server_configs[guild_id] = main.ServerConfig()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(self.post(status.voice_channel.guild, status.text_channel)
+                               for status in main.app.server_statuses.values()))
+        deadline = started + timeout
+        while self.sent and len(self.sent) > self.dropped() and time.perf_counter() < deadline:
+            self.done.clear()
+            try:
+                await asyncio.wait_for(self.done.wait(), 0.1)
+            except asyncio.TimeoutError:
+                pass
+        elapsed = time.perf_counter() - started
+
+        for status in main.app.server_statuses.values():
+            status.task.cancel()
+
+        self.report(elapsed)
+
+    def report(self, elapsed: float) -> None:
+        """ 結果出力
+
+        :param elapsed: 経過時間(秒)
+        :return: None
+        """
+        total = self.guilds * self.messages
+        current, peak = tracemalloc.get_traced_memory()
+        print('==========================================================')
+        print(f'guilds: {self.guilds}, messages/guild: {self.messages}, interval: {self.interval}s')
+        print(f'played: {len(self.latencies)}/{total}, dropped: {self.dropped()}, elapsed: {elapsed:.2f}s')
+        print(f'throughput: {len(self.latencies) / elapsed:.1f} messages/s')
+        if 2 <= len(self.latencies):
+            quantiles = statistics.quantiles(self.latencies, n=100)
+            print(f'latency p50: {quantiles[49] * 1000:.1f}ms, '
+                  f'p95: {quantiles[94] * 1000:.1f}ms, p99: {quantiles[98] * 1000:.1f}ms')
+        print(f'memory current: {current / 1024 / 1024:.1f}MB, peak: {peak / 1024 / 1024:.1f}MB')
+        print(f'audio cache hits: {main.app.audio_cache.hits}, misses: {main.app.audio_cache.misses}')
+        print('==========================================================')
+
+
+def load_app(config_path: str, latency: float, tags: dict[int, str]) -> None:
+    """ アプリケーション初期化
+    設定ファイルの音声合成バックエンドを疑似音声合成バックエンドに置き換えて初期化する
+
+    :param config_path: 設定ファイルのパス
+    :param latency: 1回の合成にかかる時間(秒)
+    :param tags: 音声と文字列の対応付けの記録先
+    :return: None
+    """
+    with open(config_path, 'r', encoding='utf-8') as yml:
+        config_dict = yaml.safe_load(yml)
+    config_dict.setdefault('synthesis', {})['backend'] = 'fake'
+    config_dict['synthesis']['disk_cache'] = {'size_mb': 0}
+    config_dict['loggers']['yomiage']['level'] = 'WARNING'
+    config_dict['handlers'].pop('file', None)
+    config_dict['loggers']['root']['handlers'] = ['console']
+
+    fd, path = tempfile.mkstemp(suffix='.yml')
+    with os.fdopen(fd, 'w', encoding='utf-8') as yml:
+        yaml.safe_dump(config_dict, yml, allow_unicode=True)
+    main.logger = logging.getLogger('yomiage')
+    try:
+        sys.argv = [sys.argv[0], path]
+        main.app = main.Yomiage()
+    finally:
+        os.remove(path)
+    main.app.synthesis_pool.backend = TaggingBackend(latency, tags)
+
+
+def benchmark_post_process(paths: list[str], voice_type: str, repeat: int = 20) -> None:
+    """ 音声後処理計測
+    設定ファイルの音声後処理を各WAVファイルに適用し、
+    1000投稿あたりの再生時間の短縮量と、1投稿あたりの処理時間を出力する
+
+    :param paths: WAVファイルのパス
+    :param voice_type: 声質
+    :param repeat: 処理時間計測の繰り返し回数
+    :return: None
+    """
+    processing = main.replace(main.app.post_process, enabled=True)
+    frame_rate = main.discord.opus.Encoder.SAMPLING_RATE * main.discord.opus.Encoder.CHANNELS * 2
+    original = 0.0
+    saved = 0.0
+    elapsed = 0.0
+    for path in paths:
+        with open(path, 'rb') as file:
+            wav = file.read()
+        pcm, _ = main.decode_wav(wav)
+        original += len(pcm) / frame_rate
+        started = time.perf_counter()
+        for _ in range(repeat):
+            _, trimmed = main.decode_wav(wav, voice_type, processing)
+        elapsed += (time.perf_counter() - started) / repeat
+        saved += trimmed
+
+    print('==========================================================')
+    print(f'files: {len(paths)}, voice_type: {voice_type}')
+    print(f'playback: {original:.2f}s, trimmed: {saved:.2f}s ({saved / original:.1%})')
+    print(f'saved per 1000 messages: {saved / len(paths) * 1000:.1f}s')
+    print(f'processing time: {elapsed / len(paths) * 1000:.2f}ms/message')
+    print('==========================================================')
+
+
+def load_opus() -> bool:
+    """ コーデック読み込み
+    同梱のコーデック(Windows)、見つからなければシステムのコーデックを読み込む
+
+    :return: 読み込めた場合はTrue
+    """
+    for name in (main.resource_path('libopus.dll'), ctypes.util.find_library('opus')):
+        if main.discord.opus.is_loaded():
+            break
+        if name:
+            try:
+                main.discord.opus.load_opus(name)
+            except OSError:
+                pass
+    return main.discord.opus.is_loaded()
+
+
+def cpu_time() -> float:
+    """ CPU時間取得
+    終了した子プロセスのCPU時間を含む(Windowsでは子プロセスの分は含まれない)
+
+    :return: CPU時間(秒)
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def benchmark_encode(paths: list[str], repeat: int = 10) -> None:
+    """ 音声エンコード計測
+    各WAVファイルについて、FFmpegPCMAudio(ffmpegのプロセスで変換し、再生スレッドでOpusエンコード)と、
+    encode_wav(プロセス内で変換・Opusエンコード)の、1投稿あたりのCPU時間と経過時間を出力する
+
+    :param paths: WAVファイルのパス
+    :param repeat: 繰り返し回数
+    :return: None
+    """
+    samples = main.discord.opus.Encoder.SAMPLES_PER_FRAME
+    results = {}
+    for name in ('FFmpegPCMAudio', 'encode_wav'):
+        if name == 'FFmpegPCMAudio' and not shutil.which('ffmpeg'):
+            print('ffmpeg is not installed. FFmpegPCMAudio is skipped.')
+            continue
+        cpu = 0.0
+        elapsed = 0.0
+        for path in paths:
+            with open(path, 'rb') as file:
+                wav = file.read()
+            started = (cpu_time(), time.perf_counter())
+            for _ in range(repeat):
+                if name == 'FFmpegPCMAudio':
+                    source = main.discord.FFmpegPCMAudio(path)
+                    encoder = main.discord.opus.Encoder()
+                    while pcm := source.read():
+                        encoder.encode(pcm, samples)
+                    source.cleanup()
+                else:
+                    main.encode_wav(wav)
+            cpu += (cpu_time() - started[0]) / repeat
+            elapsed += (time.perf_counter() - started[1]) / repeat
+        results[name] = (cpu / len(paths), elapsed / len(paths))
+
+    print('==========================================================')
+    print(f'files: {len(paths)}, repeat: {repeat}')
+    for name, (cpu, elapsed) in results.items():
+        print(f'{name}: cpu {cpu * 1000:.2f}ms/message, elapsed {elapsed * 1000:.2f}ms/message')
+    if len(results) == 2:
+        print(f'cpu ratio: {results["FFmpegPCMAudio"][0] / results["encode_wav"][0]:.1f}x')
+    print('==========================================================')
+
+
+SAMPLE_MESSAGES = (
+    'おはようございます',
+    'これから配信始めます！',
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ これ見て',
+    '<@123456789012345678> 今日何時から？',
+    '<@!12345678901234567> りょうかいです <:ok:123456789012345678>',
+    '<@&123456789012345678> 集合してください',
+    '<#123456789012345678> に書いておきました',
+    '<a:party:123456789012345678><a:party:123456789012345678> おめでとう',
+    '||ネタバレ注意|| ラスボス強すぎ',
+    '```python\nprint("hello")\n``` これで動きます',
+    '部屋番号は1234567です',
+    'ちょっと待って\n今トイレ',
+    'www',
+    '了解！あと5分で入ります',
+)
+"""
+文字列可読化の計測に使用する投稿の例
+"""
+
+
+def legacy_make_speakable(text: str) -> str:
+    """ 文字列可読化(従来の実装)
+    比較用に、正規表現を投稿ごとに5回適用していた従来の実装を再現する
+
+    :param text: 変換前文字列
+    :return: 変換後文字列
+    """
+    text = text.split(main.BACK_SLASH)[0]
+    text = re.sub(r'@\d{18}', '', text)
+    text = re.sub(r"https?://[\w/:%#$&?()~.=+\-]+", 'ゆーあーるえる', text)
+    text = re.sub(r'\d{5,}', 'たくさん', text)
+    text = re.sub(r'<:\w+:\d+>', '', text)
+    return text[:20]
+
+
+def benchmark_normalize(count: int = 100000) -> None:
+    """ 文字列可読化計測
+    投稿の例から作った文字列群に対して、従来の実装と、設定ファイルのルールによる可読化の処理量を出力する
+
+    :param count: 処理する投稿数
+    :return: None
+    """
+    corpus = random.Random(0).choices(SAMPLE_MESSAGES, k=count)
+    results = {}
+    for name, normalize in (('legacy', legacy_make_speakable), ('normalizer', main.make_speakable)):
+        started = time.perf_counter()
+        for text in corpus:
+            normalize(text)
+        results[name] = count / (time.perf_counter() - started)
+
+    print('==========================================================')
+    print(f'messages: {count}, rules: {", ".join(main.app.normalizer.replacements)}')
+    for name, throughput in results.items():
+        print(f'{name}: {throughput:,.0f} messages/s')
+    print(f'speedup: {results["normalizer"] / results["legacy"]:.2f}x')
+    print('==========================================================')
+
+
+def benchmark_dictionary(sizes: tuple[int, ...] = (10, 100, 1000, 10000), count: int = 20000) -> None:
+    """ 読み辞書計測
+    辞書の語句数ごとに、オートマトンの構築時間と、置換の処理量を出力する
+    比較用に、語句ごとにstr.replaceを繰り返す単純な置換の処理量も出力する(語句数が多いと遅いため、投稿数を減らして計測する)
+
+    :param sizes: 語句数
+    :param count: 処理する投稿数
+    :return: None
+    """
+    rand = random.Random(0)
+    kana = [chr(code) for code in range(ord('ァ'), ord('ン') + 1)]
+    print('==========================================================')
+    print(f'messages: {count}')
+    for size in sizes:
+        words = {}
+        while len(words) < size:
+            words[''.join(rand.choices(kana, k=rand.randint(2, 6)))] = 'よみ'
+        corpus = [f'{text}{rand.choice(list(words))}' for text in rand.choices(SAMPLE_MESSAGES, k=count)]
+
+        started = time.perf_counter()
+        automaton = main.AhoCorasick(words)
+        built = time.perf_counter() - started
+        started = time.perf_counter()
+        for text in corpus:
+            automaton.replace(text)
+        throughput = count / (time.perf_counter() - started)
+
+        naive_count = max(1, min(count, 2000000 // size))
+        started = time.perf_counter()
+        for text in corpus[:naive_count]:
+            for word, reading in words.items():
+                text = text.replace(word, reading)
+        naive = naive_count / (time.perf_counter() - started)
+
+        print(f'words: {size:>6}, build: {built * 1000:8.1f}ms, '
+              f'aho-corasick: {throughput:10,.0f} messages/s, str.replace: {naive:10,.0f} messages/s')
+    print('==========================================================')
+
+
+def benchmark_settings(guilds: int = 10000, users: int = 100, count: int = 200000) -> None:
+    """ 継承後設定計測
+    guilds×usersのユーザー個別設定を登録し、継承後設定索引のメモリ使用量と、
+    投稿ごとのプレフィックス・声質の取得について、設定を毎回継承する方法と索引を使用する方法の処理量を出力する
+
+    :param guilds: サーバー数
+    :param users: サーバーごとのユーザー個別設定数
+    :param count: 処理する投稿数
+    :return: None
+    """
+    rand = random.Random(0)
+    voice_types = list(main.VOICE_TYPES)
+    main.app.server_configs.clear()
+    main.app.resolved = main.ResolvedSettings()
+
+    tracemalloc.start()
+    for guild_id in range(1, guilds + 1):
+        server_config = main.ServerConfig(cmd_prefix=rand.choice(('?', '!', None)), voice_type=rand.choice(voice_types))
+        for user_id in range(1, users + 1):
+            server_config.users[user_id] = main.UserConfig(user_id, f'user{user_id}', rand.choice(voice_types + ['']))
+        main.app.server_configs[guild_id] = server_config
+    configs, _ = tracemalloc.get_traced_memory()
+    for guild_id in range(1, guilds + 1):
+        main.app.resolved.resolve(guild_id)
+    resolved = tracemalloc.get_traced_memory()[0] - configs
+    tracemalloc.stop()
+
+    messages = [(rand.randint(1, guilds), rand.randint(1, users + users // 10)) for _ in range(count)]
+    started = time.perf_counter()
+    for guild_id, user_id in messages:
+        main.get_layered_server_cmd_prefix(guild_id)
+        main.get_layered_user_voice_type(guild_id, user_id)
+    layered = count / (time.perf_counter() - started)
+    started = time.perf_counter()
+    for guild_id, user_id in messages:
+        main.app.resolved.prefix(guild_id)
+        main.app.resolved.voice_type(guild_id, user_id)
+    indexed = count / (time.perf_counter() - started)
+
+    print('==========================================================')
+    print(f'guilds: {guilds}, users/guild: {users}, messages: {count}')
+    print(f'memory settings: {configs / 1024 / 1024:.1f}MB, resolved index: {resolved / 1024 / 1024:.1f}MB')
+    print(f'layered: {layered:,.0f} messages/s, resolved: {indexed:,.0f} messages/s ({indexed / layered:.2f}x)')
+    print('==========================================================')
+
+
+def main_loadtest() -> None:
+    parser = argparse.ArgumentParser(description='yomiage load test')
+    parser.add_argument('config', nargs='?', default='config.yml', help='設定ファイルのパス')
+    parser.add_argument('--guilds', type=int, default=10, help='サーバー数')
+    parser.add_argument('--messages', type=int, default=20, help='サーバーごとの投稿数')
+    parser.add_argument('--interval', type=float, default=0.5, help='同一サーバー内の投稿間隔(秒)')
+    parser.add_argument('--latency', type=float, default=0.2, help='1回の音声合成にかかる時間(秒)')
+    parser.add_argument('--timeout', type=float, default=300, help='全投稿の再生を待つ上限時間(秒)')
+    parser.add_argument('--wav', nargs='+', help='音声後処理の計測に使用するWAVファイル')
+    parser.add_argument('--voice', default='mn', help='音声後処理の計測に使用する声質')
+    parser.add_argument('--benchmark', choices=('encode', 'normalize', 'dictionary', 'settings'),
+                        help='負荷試験の代わりに計測する処理(encode: 音声エンコード、--wavが必要 / '
+                             'normalize: 文字列可読化 / dictionary: 読み辞書 / settings: 継承後設定)')
+    args = parser.parse_args()
+
+    if args.benchmark == 'settings':
+        load_app(args.config, args.latency, {})
+        benchmark_settings()
+        return
+
+    if args.benchmark == 'dictionary':
+        benchmark_dictionary()
+        return
+
+    if args.benchmark == 'normalize':
+        load_app(args.config, args.latency, {})
+        benchmark_normalize()
+        return
+
+    if args.benchmark == 'encode':
+        if not args.wav:
+            parser.error('--benchmark encode requires --wav.')
+        load_app(args.config, args.latency, {})
+        if not load_opus():
+            print('opus is not installed.')
+            return
+        benchmark_encode(args.wav)
+        return
+
+    if args.wav:
+        load_app(args.config, args.latency, {})
+        if not main.load_numpy():
+            print('numpy is not installed.')
+            return
+        benchmark_post_process(args.wav, args.voice)
+        return
+
+    tracemalloc.start()
+    harness = Harness(args.guilds, args.messages, args.interval)
+    load_app(args.config, args.latency, harness.tags)
+    asyncio.run(harness.run(args.timeout))
+
+
+if __name__ == '__main__':
+    main_loadtest()
@@ -1,20 +1,58 @@
 import asyncio
+import audioop
+import contextlib
+import glob
+import hashlib
+import importlib.util
+import io
 import logging.config
+import mmap
+import multiprocessing
 import os
 import re
+import sqlite3
+import struct
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 import traceback
+import wave
 from asyncio import Task
-from dataclasses import dataclass, field
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, replace
 from logging import Logger
+from typing import TYPE_CHECKING
 
+STARTED_AT = time.perf_counter()
+"""
+起動時刻(外部ライブラリの読み込み開始時点)
+"""
+
+import aiohttp
 import discord
 import yaml
 from discord import VoiceChannel, VoiceClient, Message, TextChannel
 from discord.ext import commands
 from discord.ext.commands import Context
 
+if TYPE_CHECKING:
+    from aiohttp import web
+
+numpy = None
+"""
+NumPy(音声後処理を使用する場合にのみ、load_numpyで読み込む)
+読み込みに失敗した場合はFalse
+"""
+
+engine = None
+"""
+常駐音声合成エンジン(常駐エンジンを使用する場合にのみ、プロセスプールの各プロセスでinit_synthesis_processが読み込む)
+"""
+
 VERSION = '0.1.0'
 """
 アプリケーションバージョン
@@ -81,6 +119,76 @@ BACK_SLASH = '\n'
 改行文字
 """
 
+OMITTED_TEXT = '以下省略'
+"""
+読み上げ待ち行列の溢れを1件にまとめる際の文字列
+"""
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'collapse')
+"""
+読み上げ待ち行列の溢れ時の動作
+"""
+
+SPEAKABLE_RULES = {
+    'code_block': r'```[\s\S]*?```',
+    'spoiler': r'\|\|[\s\S]*?\|\|',
+    'after_first_line': r'\n[\s\S]*',
+    'url': r'https?://[\w/:%#$&?()~.=+\-]+',
+    'emoji': r'<a?:\w+:\d+>',
+    'mention': r'<@[!&]?\d+>|@\d{17,20}',
+    'channel': r'<#\d+>',
+    'number': r'\d{5,}',
+}
+"""
+文字列可読化ルール名と、置換対象のパターンのマップ
+先に記載したルールほど優先される
+"""
+
+SPEAKABLE_REPLACEMENTS = {
+    'code_block': 'こーど',
+    'spoiler': 'ひみつ',
+    'after_first_line': None,
+    'url': 'ゆーあーるえる',
+    'emoji': '',
+    'mention': '',
+    'channel': '',
+    'number': 'たくさん',
+}
+"""
+文字列可読化ルール名と、デフォルトの置換文字列のマップ
+置換文字列がNoneのルールはデフォルトで無効
+"""
+
+SENTENCE_PATTERN = re.compile(r'[^。．！？!?\n]*[。．！？!?]+|[^。．！？!?\n]+')
+"""
+文(句点・感嘆符・疑問符・改行で区切られた範囲)のパターン
+"""
+
+SENTENCE_TERMINATORS = '。．！？!?'
+"""
+文末の文字(これで終わらない文は、改行で区切られた文)
+"""
+
+PHRASE_DELIMITERS = '、，, 　'
+"""
+長すぎる文を分割する際に、区切りとして優先する文字
+"""
+
+COALESCE_KEYS = ('user', 'voice_type')
+"""
+連続投稿をまとめる単位
+"""
+
+COALESCE_SEPARATOR = '、'
+"""
+連続投稿をまとめる際の区切り文字
+"""
+
+LIMITER_RELEASE = 5
+"""
+リミッターが音量を抑え始めてから元に戻すまでの区間数(10ms単位)
+"""
+
 
 @dataclass
 class UserConfig:
@@ -92,27 +200,608 @@ class UserConfig:
     voice_type: str = ''
 
 
-@dataclass
+@dataclass(slots=True)
 class VoiceSource:
     """ 音声化元
     音声化を行う元情報
+    投稿ごとに生成されるため、__slots__で軽量化している
     """
-    user_config: UserConfig = None
+    user_id: int = 0
+    voice_type: str = ''
     text: str = ''
+    speed: str = '1.0'
+    created_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass(frozen=True)
+class EncodedAudio:
+    """ エンコード済み音声
+    20ms単位のOpusフレーム列
+    再生時に再エンコードを行わないため、キャッシュして何度でも再生できる
+    trimmedは、後処理で取り除いた無音の長さ(秒)
+    ディスクキャッシュから復元したフレームは、パックファイルのmmapを参照するmemoryviewになる
+    """
+    frames: tuple[bytes | memoryview, ...] = ()
+    trimmed: float = 0.0
+
+    @property
+    def size(self) -> int:
+        """ データサイズ
+
+        :return: 全フレームの合計サイズ(byte)
+        """
+        return sum(len(frame) for frame in self.frames)
+
+    def to_bytes(self) -> bytes:
+        """ 直列化
+        各フレームの前に、4byteのビッグエンディアンでフレーム長を付与して連結する
+
+        :return: 直列化したデータ
+        """
+        return b''.join(struct.pack('>I', len(frame)) + frame for frame in self.frames)
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview, copy: bool = True) -> 'EncodedAudio':
+        """ 復元
+        to_bytesで直列化したデータから復元する
+
+        :param data: 直列化したデータ
+        :param copy: Falseの場合、各フレームを複製せずにdataのmemoryviewのまま保持する
+        :return: エンコード済み音声
+        """
+        frames = []
+        view = memoryview(data)
+        offset = 0
+        while offset < len(view):
+            length, = struct.unpack_from('>I', view, offset)
+            offset += 4
+            if len(view) < offset + length:
+                raise ValueError('Encoded audio is truncated.')
+            frame = view[offset:offset + length]
+            frames.append(frame.tobytes() if copy else frame)
+            offset += length
+        return cls(tuple(frames))
+
+
+@dataclass(frozen=True)
+class PostProcess:
+    """ 音声後処理設定
+    音声合成後、エンコード前のPCMデータに対して行う処理の設定
+    プロセスプールの各プロセスにも渡されるため、変更不可とする
+    """
+    enabled: bool = False
+    trim_threshold: float = -45.0
+    trim_margin: float = 0.05
+    target_level: float = None
+    gains: dict[str, float] = field(default_factory=dict)
+    limiter: bool = True
+    ceiling: float = -1.0
+
+
+class AudioCache:
+    """ 読み上げ音声キャッシュ
+    生成済みの読み上げ音声を、(文字列, 声質, 発声のスピード)をキーとして保持するLRUキャッシュ
+    保持する音声の合計サイズが上限を超えた場合は、最も長く使用されていないものから破棄する
+    """
+
+    def __init__(self, max_bytes: int):
+        """ 初期化処理
+
+        :param max_bytes: 保持する音声の合計サイズ上限(byte)
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entries: OrderedDict[tuple[str, str, str], EncodedAudio] = OrderedDict()
+
+    @staticmethod
+    def key_of(source: VoiceSource) -> tuple[str, str, str]:
+        """ キャッシュキー生成
+
+        :param source: 音声化元
+        :return: キャッシュキー
+        """
+        return source.text, source.voice_type, source.speed
+
+    def get(self, key: tuple[str, str, str]) -> EncodedAudio | None:
+        """ キャッシュ取得
+        ヒットした場合は、そのエントリを最新として扱う
+
+        :param key: キャッシュキー
+        :return: エンコード済み音声(キャッシュに無い場合はNone)
+        """
+        audio = self.entries.get(key)
+        if audio is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return audio
+
+    def put(self, key: tuple[str, str, str], audio: EncodedAudio) -> None:
+        """ キャッシュ登録
+        上限を超えた分は、古いエントリから破棄する
+        上限を超える大きさの音声は登録しない
+
+        :param key: キャッシュキー
+        :param audio: エンコード済み音声
+        :return: None
+        """
+        size = audio.size
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key).size
+        self.entries[key] = audio
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+
+class DiskAudioStore:
+    """ 読み上げ音声ディスクキャッシュ
+    生成済みの読み上げ音声を、追記専用のパックファイルに保存し、再起動後も再利用する
+    パックファイルの各レコードは、ヘッダー(識別子・キーのハッシュ・キー長・データ長・除去した無音の長さ)、キー、
+    EncodedAudio.to_bytesで直列化した音声の順に並ぶ
+    パックファイルはmmapで読み込み、キーのハッシュからレコードの位置を引く索引をメモリ上に持つため、
+    ヒット時にファイルの読み込みは発生しない
+    複数のボットプロセスで共有できるよう、追記と整理はロックファイルで排他する
+    整理(サイズ上限を超えた場合に、最近使われたものを残して新しいパックファイルへ書き出す)のたびに世代番号を上げ、
+    現在の世代番号をcurrentファイルに記録する
+    古い世代のパックファイルは、他のプロセスが読み込み中でも影響が無いよう、削除できるようになった時点で削除する
+    ファイル操作はすべて専用のスレッドで行う
+    """
+
+    HEADER = struct.Struct('>4sQIId')
+    """
+    レコードヘッダー(識別子, キーのハッシュ, キー長, データ長, 除去した無音の長さ)
+    """
+
+    MAGIC = b'YAS1'
+    """
+    レコード識別子
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        """ 初期化処理
+
+        :param directory: 保存先ディレクトリ
+        :param max_bytes: パックファイルのサイズ上限(byte)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audio-store')
+        self.generation = -1
+        self.end = 0
+        self.view: tuple[mmap.mmap | None, dict[int, tuple[int, int, int, float]]] = (None, {})
+        self.used: dict[int, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash_of(key: bytes) -> int:
+        """ キーのハッシュ計算
+
+        :param key: キー
+        :return: 64bitのハッシュ
+        """
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+
+    @staticmethod
+    def key_of(key: tuple[str, str, str]) -> bytes:
+        """ キー変換
+        AudioCacheのキーを、レコードに保存するキーへ変換する
+
+        :param key: キャッシュキー
+        :return: レコードのキー
+        """
+        return '\0'.join(key).encode('utf-8')
+
+    def pack_path(self, generation: int) -> str:
+        """ パックファイルパス取得
+
+        :param generation: 世代番号
+        :return: パックファイルのパス
+        """
+        return os.path.join(self.directory, f'audio.{generation}.pack')
+
+    @contextlib.contextmanager
+    def locked(self):
+        """ プロセス間排他
+        ロックファイルを排他ロックしている間だけ処理を行う
+
+        :return: コンテキストマネージャー
+        """
+        with open(os.path.join(self.directory, 'audio.lock'), 'a+b') as file:
+            if os.name == 'nt':
+                import msvcrt
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    def current_generation(self) -> int:
+        """ 現在の世代番号取得(専用スレッド)
+
+        :return: 世代番号(パックファイルが無い場合は0)
+        """
+        try:
+            with open(os.path.join(self.directory, 'audio.current'), 'r', encoding='utf-8') as file:
+                return int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def refresh(self) -> None:
+        """ 索引更新(専用スレッド)
+        世代が変わっていれば新しいパックファイルを開き直し、
+        前回の読み込み以降に(他のプロセスも含めて)追記されたレコードを索引に加える
+        書き込み途中のレコードは、次回の更新で読み込む
+
+        :return: None
+        """
+        generation = self.current_generation()
+        if generation != self.generation:
+            self.generation = generation
+            self.end = 0
+            self.view = (None, {})
+        path = self.pack_path(generation)
+        if not os.path.isfile(path) or os.path.getsize(path) <= self.end:
+            return
+
+        with open(path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        # イベントループが参照中の索引を変更しないよう、複製に追加する
+        index = dict(self.view[1])
+        offset = self.end
+        while offset + self.HEADER.size <= len(data):
+            magic, key_hash, key_length, data_length, trimmed = self.HEADER.unpack_from(data, offset)
+            if magic != self.MAGIC:
+                logger.error(f'Audio store ({path}) is broken at ({offset}). Ignored after it.')
+                offset = len(data)
+                break
+            end = offset + self.HEADER.size + key_length + data_length
+            if len(data) < end:
+                break
+            index[key_hash] = (offset + self.HEADER.size, key_length, data_length, trimmed)
+            offset = end
+        self.end = offset
+        # 読み込み中のスレッドが古いmmapを参照していても問題無いよう、mmapと索引の組を丸ごと差し替える
+        self.view = (data, index)
+
+    def find(self, key: tuple[str, str, str]) -> EncodedAudio | None:
+        """ 音声検索
+        イベントループから直接呼び出される(ファイルの読み込みは発生しない)
+        フレームはmmapのmemoryviewとして複製せずに返すため、
+        返却した音声を参照している間は、整理後も古いパックファイルのmmapが解放されない
+
+        :param key: キャッシュキー
+        :return: エンコード済み音声(索引に無い場合はNone)
+        """
+        data, index = self.view
+        record = self.key_of(key)
+        key_hash = self.hash_of(record)
+        entry = index.get(key_hash)
+        if entry is None:
+            return None
+        view = memoryview(data)
+        offset, key_length, data_length, trimmed = entry
+        if view[offset:offset + key_length] != record:
+            return None
+        try:
+            audio = EncodedAudio.from_bytes(view[offset + key_length:offset + key_length + data_length], False)
+        except (ValueError, struct.error):
+            logger.error(f'Audio store record at ({offset}) is broken. Ignored.')
+            return None
+        self.used[key_hash] = time.monotonic()
+        return replace(audio, trimmed=trimmed)
+
+    async def get(self, key: tuple[str, str, str]) -> EncodedAudio | None:
+        """ 音声取得
+        索引に無い場合は、他のプロセスが追記したレコードを取り込むため、
+        専用スレッドで索引を更新(パックファイルのサイズが変わっていなければ何もしない)してから再度検索する
+
+        :param key: キャッシュキー
+        :return: エンコード済み音声(保存されていない場合はNone)
+        """
+        audio = self.find(key)
+        if audio is None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.refresh)
+            audio = self.find(key)
+        if audio is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return audio
+
+    def append(self, key: tuple[str, str, str], audio: EncodedAudio) -> None:
+        """ 音声追記(専用スレッド)
+        他のプロセスが同じ音声を既に追記していた場合は、追記しない
+        書き込み途中で終了したプロセスが残した不完全なレコードがあれば、追記の前に取り除く
+        追記によってサイズ上限を超えた場合は整理を行う
+
+        :param key: キャッシュキー
+        :param audio: エンコード済み音声
+        :return: None
+        """
+        record = self.key_of(key)
+        key_hash = self.hash_of(record)
+        payload = audio.to_bytes()
+        with self.locked():
+            self.refresh()
+            if key_hash in self.view[1]:
+                return
+            path = self.pack_path(self.generation)
+            if os.path.isfile(path) and self.end < os.path.getsize(path):
+                logger.warning(f'Audio store ({path}) has a partial record at ({self.end}). Truncated.')
+                try:
+                    os.truncate(path, self.end)
+                except OSError:
+                    # 読み込み中のパックファイルを切り詰められない環境(Windows)では、整理して次の世代へ移る
+                    self.compact()
+            with open(self.pack_path(self.generation), 'ab') as file:
+                file.write(self.HEADER.pack(self.MAGIC, key_hash, len(record), len(payload), audio.trimmed))
+                file.write(record)
+                file.write(payload)
+            self.used[key_hash] = time.monotonic()
+            self.refresh()
+            if self.max_bytes < self.end:
+                self.compact()
+
+    def compact(self) -> None:
+        """ 整理(専用スレッド、ロック取得済み)
+        最近使われた音声から順に、サイズ上限の半分に収まるまでを次の世代のパックファイルへ書き出し、世代を切り替える
+
+        :return: None
+        """
+        data, index = self.view
+        used = dict(self.used)
+        entries = sorted(index.items(), key=lambda item: (used.get(item[0], 0.0), item[1][0]), reverse=True)
+        generation = self.generation + 1
+        size = 0
+        with open(self.pack_path(generation), 'wb') as file:
+            for key_hash, (offset, key_length, data_length, trimmed) in entries:
+                length = self.HEADER.size + key_length + data_length
+                if self.max_bytes // 2 < size + length:
+                    break
+                file.write(self.HEADER.pack(self.MAGIC, key_hash, key_length, data_length, trimmed))
+                file.write(data[offset:offset + key_length + data_length])
+                size += length
+        del data, index
+        current = os.path.join(self.directory, 'audio.current')
+        with open(current + '.tmp', 'w', encoding='utf-8') as file:
+            file.write(str(generation))
+        os.replace(current + '.tmp', current)
+        logger.info(f'Compacted audio store to generation ({generation}) ({size // 1024}KB).')
+
+        self.refresh()
+        self.used = {key_hash: used[key_hash] for key_hash in self.view[1] if key_hash in used}
+        for path in glob.glob(os.path.join(self.directory, 'audio.*.pack')):
+            if path != self.pack_path(generation):
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+    def open(self) -> None:
+        """ 読み込み開始(専用スレッド)
+
+        :return: None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.refresh()
+        logger.info(f'Audio store loaded ({len(self.view[1])}) entries from generation ({self.generation}).')
+
+    async def load(self) -> None:
+        """ 読み込み開始
+
+        :return: None
+        """
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.open)
+
+    def put(self, key: tuple[str, str, str], audio: EncodedAudio) -> None:
+        """ 音声保存
+        追記を専用スレッドに依頼し、完了は待たない
+
+        :param key: キャッシュキー
+        :param audio: エンコード済み音声
+        :return: None
+        """
+        def on_appended(future: asyncio.Future) -> None:
+            if not future.cancelled() and future.exception():
+                logger.error(f'Failed to append audio store: {future.exception()!r}')
+
+        asyncio.get_running_loop().run_in_executor(self.executor, self.append, key, audio).add_done_callback(
+            on_appended)
+
+    def close(self) -> None:
+        """ 終了処理
+        書き込み待ちの追記を完了させてから終了する
+
+        :return: None
+        """
+        self.executor.shutdown()
+
+
+class OpusFramesAudio(discord.AudioSource):
+    """ エンコード済み音声ソース
+    EncodedAudioのOpusフレームを、再エンコードせずにそのまま再生する
+    """
+
+    def __init__(self, audio: EncodedAudio):
+        """ 初期化処理
+
+        :param audio: エンコード済み音声
+        """
+        self.audio = audio
+        self.frames = iter(audio.frames)
+
+    def read(self) -> bytes:
+        """ フレーム読み込み
+
+        :return: 20ms分のOpusフレーム(終端の場合は空)
+        """
+        return next(self.frames, b'')
+
+    def is_opus(self) -> bool:
+        """ Opus判定
+
+        :return: True
+        """
+        return True
+
+
+class Coalesce:
+    """ 連続投稿まとめ設定保持クラス
+    """
+    enabled: bool = False
+    key: str = 'user'
+    window: float = 0
+    max_length: int = 0
+
+
+class VoiceQueue:
+    """ 読み上げ待ち行列
+    上限件数を持つサーバーごとの待ち行列
+    上限を超えて投稿された場合は、溢れ時の動作に従って古いものを捨てる・新しいものを捨てる・
+    「以下省略」の1件にまとめる のいずれかを行う
+    まとめ設定が有効な場合、同じユーザー(または声質)の短時間の連続投稿は、
+    読み上げ待ちの最後の1件に連結して1回の音声合成で読み上げる
+    """
+
+    def __init__(self, max_depth: int, overflow: str, coalesce: Coalesce):
+        """ 初期化処理
+
+        :param max_depth: 上限件数(0の場合は無制限)
+        :param overflow: 溢れ時の動作(OVERFLOW_POLICIESのいずれか)
+        :param coalesce: 連続投稿まとめ設定
+        """
+        self.max_depth = max_depth
+        self.overflow = overflow
+        self.coalesce = coalesce
+        self.items: deque[VoiceSource] = deque()
+        self.not_empty = asyncio.Event()
+        self.dropped = 0
+        self.coalesced = 0
+
+    def try_coalesce(self, source: VoiceSource) -> bool:
+        """ 連続投稿まとめ
+        読み上げ待ちの最後の1件と連結可能であれば連結する
+        連結できるのは、まとめる単位(ユーザーまたは声質)と発声のスピードが同じで、
+        最後の1件の最初の投稿から一定時間内、かつ連結後の文字数が上限以下の場合のみ
+
+        :param source: 音声化元
+        :return: 連結した場合はTrue
+        """
+        if not self.coalesce.enabled or not self.items:
+            return False
+        last = self.items[-1]
+        if last.text == OMITTED_TEXT or last.speed != source.speed:
+            return False
+        if self.coalesce.key == 'user':
+            if last.user_id != source.user_id:
+                return False
+        elif last.voice_type != source.voice_type:
+            return False
+        if self.coalesce.window < source.created_at - last.created_at:
+            return False
+        text = f'{last.text}{COALESCE_SEPARATOR}{source.text}'
+        if self.coalesce.max_length < len(text):
+            return False
+        self.items[-1] = replace(last, text=text)
+        self.coalesced += 1
+        return True
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def put_nowait(self, source: VoiceSource) -> None:
+        """ 登録
+
+        :param source: 音声化元
+        :return: None
+        """
+        if self.try_coalesce(source):
+            return
+        if self.max_depth and self.max_depth <= len(self.items):
+            self.dropped += 1
+            app.metrics.dropped += 1
+            if self.overflow == 'drop_oldest':
+                self.items.popleft()
+            elif self.overflow == 'collapse':
+                last = self.items[-1]
+                if last.text != OMITTED_TEXT:
+                    self.items[-1] = replace(last, text=OMITTED_TEXT)
+                return
+            else:
+                return
+        self.items.append(source)
+        self.not_empty.set()
+
+    async def put(self, source: VoiceSource) -> None:
+        """ 登録(コルーチン版)
+
+        :param source: 音声化元
+        :return: None
+        """
+        self.put_nowait(source)
+
+    async def get(self) -> VoiceSource:
+        """ 取り出し
+        待ち行列が空の場合は、登録されるまで待機する
+
+        :return: 音声化元
+        """
+        while not self.items:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        return self.items.popleft()
+
+    def clear(self) -> int:
+        """ 全削除
+
+        :return: 削除した件数
+        """
+        count = len(self.items)
+        self.items.clear()
+        return count
 
 
 @dataclass
 class YomiageStatus:
     """ サーバー
     VC接続後、1サーバーに対して1つ割り当てられるインスタンス
+    text_channelは通知先のテキストチャンネル、text_channelsは読み上げ対象のすべてのテキストチャンネル
     """
     id: int = 0
     text_channel: TextChannel = None
     voice_channel: VoiceChannel = None
+    text_channels: dict[int, TextChannel] = field(default_factory=dict)
     users: dict[int, UserConfig] = field(default_factory=dict)
-    voice_que = asyncio.Queue()
-    play_next_voice = asyncio.Event()
+    voice_que: VoiceQueue = field(
+        default_factory=lambda: VoiceQueue(app.queue_max_depth, app.queue_overflow, app.coalesce))
+    play_next_voice: asyncio.Event = field(default_factory=asyncio.Event)
+    render_que: asyncio.Queue = None
+    render_slots: asyncio.Semaphore = None
+    generation: int = 0
+    playing: VoiceSource = None
+    skipped: VoiceSource = None
+    expired: int = 0
     task: Task = None
+    loop: asyncio.AbstractEventLoop = None
+    last_active: float = field(default_factory=time.monotonic)
+    empty_since: float = None
 
     def toggle_next_voice(self, error: Exception) -> None:
         """ 再生終了コールバック
@@ -121,31 +810,1176 @@ class YomiageStatus:
         :param error: 例外
         :return: None
         """
-        client.loop.call_soon_threadsafe(self.play_next_voice.set)
+        self.loop.call_soon_threadsafe(self.play_next_voice.set)
 
-    async def voice_play_task(self):
+    def speaking_rate(self, source: VoiceSource) -> tuple[str, bool]:
+        """ 読み上げ速度決定
+        目標遅延が設定されている場合、投稿の待ち時間と読み上げ待ちの件数に応じて速度を上げる
+        待ち時間が目標遅延に達するか待ち行列が上限まで埋まると最高速度になり、待ちが解消すると最低速度に戻る
+        最高速度でも追いつかない場合は、投稿の先頭部分だけを読み上げる(設定で無効化できる)
+        キャッシュが効くよう、速度は0.1刻みに丸める
+
+        :param source: 音声化元
+        :return: 発声のスピード・先頭部分だけを読み上げるか
+        """
+        rate_min, rate_max, target_latency = app.resolved.rate(self.id)
+        if not target_latency:
+            return format_speed(rate_min), False
+        pressure = (time.monotonic() - source.created_at) / target_latency
+        if app.queue_max_depth:
+            pressure = max(pressure, len(self.voice_que) / app.queue_max_depth)
+        rate = rate_min + (rate_max - rate_min) * min(pressure, 1.0)
+        return format_speed(rate), app.rate_truncate and 1.0 < pressure
+
+    async def voice_render_task(self) -> None:
+        """ 先読み音声生成タスク
+        voice_play_taskから起動される
+        voice_queから取り出した音声化元の音声生成を即座に開始し、
+        生成中のタスクをrender_queへ渡す
+        生成中・生成済みで再生待ちの音声が先読み数に達している間は、次の音声生成を開始せずに待機する
+        先読み中の各音声は、それぞれ個別のメモリ上のバッファに保持される
+        長い投稿は文の区切りで分割し、先頭から順に音声化する
+        先頭の音声を再生している間に後続の音声が生成されるため、再生開始までの時間は投稿の長さによらない
+        投稿から上限時間を超えて待たされたものは、音声化せずに破棄する
+
+        :return: None
+        """
+        while True:
+            current = await self.voice_que.get()
+            self.last_active = time.monotonic()
+            if app.queue_max_age and app.queue_max_age < time.monotonic() - current.created_at:
+                self.expired += 1
+                app.metrics.expired += 1
+                logger.debug(f'Discarded expired message ({current.text}).')
+                continue
+            generation = self.generation
+            speed, truncate = self.speaking_rate(current)
+            chunks = app.normalizer.split(current.text)
+            if truncate:
+                chunks = chunks[:1]
+            for index, chunk in enumerate(chunks):
+                if generation != self.generation or current is self.skipped:
+                    break
+                await self.render_slots.acquire()
+                rendering = asyncio.ensure_future(render_wav(self.id, replace(current, text=chunk, speed=speed)))
+                self.render_que.put_nowait((generation, current, index, rendering))
+
+    async def voice_play_task(self) -> None:
         """ 再生タスク
         サーバーごとに常駐するタスク
-        voice_queに新しいキューが入ると処理を実行し、
+        先読み音声生成タスクを起動し、生成された音声を順に再生して、
         再生の終了を待ち合わせる
 
         :return: None
         """
-        input_file = resource_path(f'{self.id}.txt')
-        output_file = resource_path(f'{self.id}.wav')
+        self.loop = asyncio.get_running_loop()
+        self.render_que = asyncio.Queue()
+        self.render_slots = asyncio.Semaphore(app.lookahead)
+        render_task = asyncio.ensure_future(self.voice_render_task())
+        try:
+            while True:
+                self.play_next_voice.clear()
+                generation, current, index, rendering = await self.render_que.get()
+                self.render_slots.release()
+                if generation != self.generation or current is self.skipped:
+                    rendering.cancel()
+                    continue
+                try:
+                    audio = await rendering
+                    source = OpusFramesAudio(audio)
+                    self.playing = current
+                    app.metrics.played += 1
+                    app.metrics.trimmed_seconds += audio.trimmed
+                    self.voice_channel.guild.voice_client.play(source, after=self.toggle_next_voice)
+                    if not index:
+                        app.metrics.playback_delay.observe(time.monotonic() - current.created_at)
+                    await self.play_next_voice.wait()
+                except asyncio.CancelledError:
+                    raise
+                except:
+                    logger.exception('Exception in voice play task.')
+                    tb = tb = traceback.format_exc()
+                    if self.text_channel:
+                        await error_message(self.text_channel, app.msg.task.e_failed, None, str(sys.exc_info()), tb)
+        finally:
+            render_task.cancel()
+            while not self.render_que.empty():
+                self.render_que.get_nowait()[-1].cancel()
+
+    def skip(self) -> bool:
+        """ 読み上げスキップ
+        再生中の読み上げを停止し、次の投稿の読み上げへ進む
+        分割して読み上げている投稿は、残りの部分も読み上げない
+
+        :return: 再生中の読み上げがあった場合はTrue
+        """
+        voice_client = self.voice_channel.guild.voice_client
+        if voice_client and voice_client.is_playing():
+            self.skipped = self.playing
+            voice_client.stop()
+            return True
+        return False
+
+    def clear(self) -> int:
+        """ 読み上げ全削除
+        読み上げ待ち行列と先読み中の音声をすべて破棄し、再生中の読み上げを停止する
+
+        :return: 破棄した件数
+        """
+        count = self.voice_que.clear()
+        self.generation += 1
+        while self.render_que and not self.render_que.empty():
+            self.render_que.get_nowait()[-1].cancel()
+            self.render_slots.release()
+            count += 1
+        self.skip()
+        return count
+
+    def watch(self, channel: TextChannel) -> bool:
+        """ 読み上げ対象追加
+        テキストチャンネルを読み上げ対象に加え、チャンネル索引に登録する
+        通知先が無ければ、そのチャンネルを通知先とする
+
+        :param channel: テキストチャンネル
+        :return: 追加した場合はTrue(既に読み上げ対象だった場合はFalse)
+        """
+        if channel.id in self.text_channels:
+            return False
+        self.text_channels[channel.id] = channel
+        app.routes[channel.id] = self
+        if not self.text_channel:
+            self.text_channel = channel
+        return True
+
+    def unwatch(self, channel_id: int) -> bool:
+        """ 読み上げ対象削除
+        テキストチャンネルを読み上げ対象から外し、チャンネル索引から削除する
+        通知先のチャンネルだった場合は、残りの読み上げ対象のいずれかを通知先とする
+
+        :param channel_id: channel id
+        :return: 削除した場合はTrue(読み上げ対象でなかった場合はFalse)
+        """
+        if self.text_channels.pop(channel_id, None) is None:
+            return False
+        if app.routes.get(channel_id) is self:
+            del app.routes[channel_id]
+        if self.text_channel and self.text_channel.id == channel_id:
+            self.text_channel = next(iter(self.text_channels.values()), None)
+        return True
+
+    def unwatch_all(self) -> None:
+        """ 読み上げ対象全削除
+        通知先は残す(終了の通知に使用するため)
+
+        :return: None
+        """
+        text_channel = self.text_channel
+        for channel_id in list(self.text_channels):
+            self.unwatch(channel_id)
+        self.text_channel = text_channel
+
+    def update_listeners(self) -> None:
+        """ 聞き手確認
+        接続中のボイスチャンネルにボット以外のユーザーがいなくなった時刻を記録する
+        ユーザーが戻った場合は記録を消去する
+
+        :return: None
+        """
+        if any(not member.bot for member in self.voice_channel.members):
+            self.empty_since = None
+        elif self.empty_since is None:
+            self.empty_since = time.monotonic()
+
+    def queue_depth(self) -> int:
+        """ 読み上げ待ち件数
+        読み上げ待ち行列と先読み中の音声の合計件数を返却する
+
+        :return: 件数
+        """
+        depth = len(self.voice_que)
+        if self.render_que:
+            depth += self.render_que.qsize()
+        return depth
+
+
+class SynthesisBackend:
+    """ 音声合成バックエンド
+    音声化元からエンコード済み音声を生成する処理の基底クラス
+    SynthesisPoolのワーカーから呼び出される
+    """
+
+    async def render(self, source: VoiceSource) -> EncodedAudio:
+        """ 音声生成
+
+        :param source: 音声化元
+        :return: エンコード済み音声
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """ 終了処理
+
+        :return: None
+        """
+
+
+class OpenJTalkBackend(SynthesisBackend):
+    """ open_jtalk音声合成バックエンド
+    create_wavで音声合成を行い、別スレッドでエンコードを行う
+    """
+
+    async def render(self, source: VoiceSource) -> EncodedAudio:
+        wav = await create_wav(source)
+        started = time.perf_counter()
+        audio = await asyncio.get_running_loop().run_in_executor(
+            None, encode_wav, wav, source.voice_type, app.post_process)
+        app.metrics.encode.observe(time.perf_counter() - started)
+        return audio
+
+
+class ResidentEngine:
+    """ 常駐音声合成エンジン
+    pyopenjtalk(Open JTalkのライブラリのバインディング)を使用し、辞書とすべての声質の音響モデルを読み込んだまま保持する
+    open_jtalkのプロセスの起動と、合成のたびの辞書・音響モデルの読み込みが発生しない
+    pyopenjtalkはUTF-8版の辞書のみ使用できるため、Shift_JIS版のresource/dicは使用しない
+    """
+
+    def __init__(self, dictionary: str = ''):
+        """ 初期化処理
+        辞書と、VOICE_TYPESのすべての音響モデルを読み込む
+
+        :param dictionary: UTF-8版の辞書のディレクトリ(空の場合は、pyopenjtalkがダウンロードした辞書)
+        """
+        if dictionary:
+            os.environ['OPEN_JTALK_DICT_DIR'] = dictionary
+        import pyopenjtalk
+        self.pyopenjtalk = pyopenjtalk
+        self.voices = {
+            voice_type: pyopenjtalk.HTSEngine(resource_path(os.path.join('htsvoice', file)).encode('utf-8'))
+            for voice_type, file in VOICE_TYPES.items()}
+        # 辞書は最初の解析時に読み込まれるため、ここで読み込んでおく
+        pyopenjtalk.extract_fullcontext('あ')
+
+    def synthesize(self, text: str, voice_type: str, speed: str) -> bytes:
+        """ 音声合成
+
+        :param text: 文字列
+        :param voice_type: 声質
+        :param speed: 発声のスピード
+        :return: WAVデータ(16bit・モノラル)
+        """
+        voice = self.voices[voice_type]
+        voice.set_speed(float(speed))
+        samples = voice.synthesize(self.pyopenjtalk.extract_fullcontext(text))
+        output = io.BytesIO()
+        with wave.open(output, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(voice.get_sampling_frequency())
+            wav.writeframes(samples.clip(-32768, 32767).astype('<i2').tobytes())
+        return output.getvalue()
+
+
+class ProcessPoolBackend(SynthesisBackend):
+    """ プロセスプール音声合成バックエンド
+    音声合成とエンコードを別プロセスのプロセスプールで行い、イベントループのプロセスのCPUを通信処理に専念させる
+    常駐エンジンを使用する場合は、各プロセスが常駐音声合成エンジンを1つずつ保持し、open_jtalkのプロセスを起動しない
+    プロセスプールのプロセスが異常終了していた場合は、プロセスプールを作り直す
+    タイムアウトした場合は、実行中の合成を取り消せないため、プロセスを終了させてプロセスプールを作り直す
+    """
+
+    def __init__(self, processes: int, timeout: float, resident: bool = False, dictionary: str = ''):
+        """ 初期化処理
+
+        :param processes: プロセス数
+        :param timeout: 1回の合成のタイムアウト(秒)
+        :param resident: 常駐エンジンを使用する場合はTrue
+        :param dictionary: 常駐エンジンの辞書のディレクトリ
+        """
+        self.processes = processes
+        self.timeout = timeout
+        self.resident = resident
+        self.dictionary = dictionary
+        self.process_pool: ProcessPoolExecutor = None
+
+    async def render(self, source: VoiceSource) -> EncodedAudio:
+        if not self.process_pool:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.processes, initializer=init_synthesis_process,
+                initargs=(self.resident, self.dictionary))
+        # 待機中に別の合成がプールを作り直すことがあるため、投入したプールを覚えておく
+        process_pool = self.process_pool
+        try:
+            return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(
+                process_pool, render_in_process,
+                source.text, source.voice_type, source.speed, self.timeout, app.post_process), self.timeout)
+        except asyncio.TimeoutError:
+            if self.process_pool is process_pool:
+                logger.error(f'Synthesis process did not respond in ({self.timeout})s. Recreating.')
+                self.process_pool = None
+            self.terminate(process_pool)
+            raise
+        except BrokenProcessPool:
+            if self.process_pool is process_pool:
+                logger.error('Synthesis process pool is broken. Recreating.')
+                self.process_pool = None
+            process_pool.shutdown(wait=False)
+            raise
+
+    @staticmethod
+    def terminate(process_pool: ProcessPoolExecutor) -> None:
+        """ プロセスプール強制終了
+        応答の無いプロセスを含め、プロセスプールのすべてのプロセスを終了させる
+        同じプロセスプールで実行中の他の合成は、BrokenProcessPoolで失敗する
+
+        :param process_pool: プロセスプール
+        :return: None
+        """
+        # ProcessPoolExecutorには実行中のプロセスを終了させる公開APIが無いため、内部のプロセス一覧を参照する
+        processes = list((getattr(process_pool, '_processes', None) or {}).values())
+        process_pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def close(self) -> None:
+        if self.process_pool:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+
+
+class FakeSynthesisBackend(SynthesisBackend):
+    """ 疑似音声合成バックエンド
+    負荷試験用のバックエンド
+    open_jtalkやコーデックを使用せず、指定した時間だけ待機したのち、
+    文字数に比例した長さの無音のOpusフレームを返却する(同じ文字列には常に同じ音声を返す)
+    """
+
+    SILENCE_FRAME = b'\xf8\xff\xfe'
+    """
+    20ms分の無音のOpusフレーム
+    """
+
+    def __init__(self, latency: float, frames_per_char: int = 8):
+        """ 初期化処理
+
+        :param latency: 1回の合成にかかる時間(秒)
+        :param frames_per_char: 1文字あたりのフレーム数
+        """
+        self.latency = latency
+        self.frames_per_char = frames_per_char
+
+    async def render(self, source: VoiceSource) -> EncodedAudio:
+        await asyncio.sleep(self.latency)
+        return EncodedAudio((self.SILENCE_FRAME,) * (max(1, len(source.text)) * self.frames_per_char))
+
+
+class RemoteSynthesisBackend(SynthesisBackend):
+    """ リモート音声合成バックエンド
+    別のマシンで起動した音声合成サーバー(--synthesis-serverで起動したyomiage)へ音声合成を依頼する
+    接続はサーバーごとにプールして再利用する
+    定期的にヘルスチェックを行い、応答の無いサーバーは回復するまで使用しない
+    依頼に失敗した場合は次のサーバーへ切り替え、すべて失敗した場合はローカルのバックエンドで合成する
+    """
+
+    def __init__(self, urls: list[str], timeout: float, health_interval: float, connections: int,
+                 fallback: SynthesisBackend):
+        """ 初期化処理
+
+        :param urls: 音声合成サーバーのURLのリスト
+        :param timeout: 1回の依頼のタイムアウト(秒)
+        :param health_interval: ヘルスチェック間隔(秒)
+        :param connections: サーバーごとの最大接続数
+        :param fallback: すべてのサーバーが利用できない場合に使用するバックエンド
+        """
+        self.fallback = fallback
+        self.urls = [url.rstrip('/') for url in urls]
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.connections = connections
+        self.healthy: set[str] = set(self.urls)
+        self.next = 0
+        self.session: aiohttp.ClientSession = None
+        self.health_task: Task = None
+
+    def start(self) -> None:
+        """ 接続準備
+        初回呼び出し時に、セッションとヘルスチェックタスクを作成する
+
+        :return: None
+        """
+        if not self.session:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.health_task = asyncio.ensure_future(self.health_check_task())
+
+    async def check(self, url: str) -> bool:
+        """ ヘルスチェック
+
+        :param url: 音声合成サーバーのURL
+        :return: 応答があればTrue
+        """
+        try:
+            async with self.session.get(f'{url}/health') as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def health_check_task(self) -> None:
+        """ ヘルスチェックタスク
+        すべてのサーバーのヘルスチェックを定期的に行う
+        取り消されたときは、セッションを閉じて終了する
+
+        :return: None
+        """
+        try:
+            while True:
+                results = await asyncio.gather(*(self.check(url) for url in self.urls))
+                for url, healthy in zip(self.urls, results):
+                    if healthy and url not in self.healthy:
+                        logger.info(f'Synthesis server ({url}) recovered.')
+                        self.healthy.add(url)
+                    elif not healthy and url in self.healthy:
+                        logger.warning(f'Synthesis server ({url}) is not responding.')
+                        self.healthy.discard(url)
+                await asyncio.sleep(self.health_interval)
+        except asyncio.CancelledError:
+            # 終了処理、またはイベントループ終了時のタスク取り消しで、プールした接続を閉じる
+            await self.session.close()
+            raise
+
+    async def render(self, source: VoiceSource) -> EncodedAudio:
+        """ 音声生成依頼
+        正常なサーバーに順番に依頼し、失敗したサーバーは次のヘルスチェックまで使用しない
+
+        :param source: 音声化元
+        :return: エンコード済み音声
+        """
+        self.start()
+        self.next += 1
+        for index in range(len(self.urls)):
+            url = self.urls[(self.next + index) % len(self.urls)]
+            if url not in self.healthy:
+                continue
+            try:
+                async with self.session.post(f'{url}/synthesize', json={
+                    'text': source.text,
+                    'voice_type': source.voice_type,
+                    'speed': source.speed,
+                }) as response:
+                    response.raise_for_status()
+                    return EncodedAudio.from_bytes(await response.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                logger.warning(f'Synthesis server ({url}) failed. Trying next server.', exc_info=True)
+                self.healthy.discard(url)
+
+        logger.warning('No synthesis server available. Falling back to local synthesis.')
+        return await self.fallback.render(source)
+
+    def close(self) -> None:
+        """ 終了処理
+        ヘルスチェックタスクを取り消して(セッションはタスクが閉じる)、ローカルのバックエンドを終了する
+
+        :return: None
+        """
+        if self.health_task:
+            self.health_task.cancel()
+        self.fallback.close()
+
+
+class SynthesisPool:
+    """ 音声合成ワーカープール
+    全サーバーで共有される、常駐の音声合成ワーカー群
+    合成要求はサーバーごとの待ち行列に登録され、ワーカーはサーバーを巡回(ラウンドロビン)しながら1件ずつ取り出す
+    これにより、投稿の多いサーバーがワーカーを占有し、他のサーバーの読み上げが待たされることを防ぐ
+    同時に実行される合成はワーカー数までに制限される
+    異常終了したワーカーは自動的に再起動される
+    音声合成そのものは、指定された音声合成バックエンドで行う
+    """
+
+    def __init__(self, workers: int, timeout: float, backend: SynthesisBackend):
+        """ 初期化処理
+
+        :param workers: ワーカー数
+        :param timeout: 1回の合成のタイムアウト(秒)
+        :param backend: 音声合成バックエンド
+        """
+        self.size = workers
+        self.timeout = timeout
+        self.backend = backend
+        self.busy = 0
+        self.pending: dict[int, deque[tuple[VoiceSource, asyncio.Future]]] = {}
+        self.ready: deque[int] = deque()
+        self.available = asyncio.Semaphore(0)
+        self.workers: dict[int, Task] = {}
+
+    def start(self) -> None:
+        """ ワーカー起動
+        起動していないワーカーを起動する
+
+        :return: None
+        """
+        for number in range(self.size):
+            if number not in self.workers:
+                self.start_worker(number)
+
+    def start_worker(self, number: int) -> None:
+        """ ワーカー個別起動
+
+        :param number: ワーカー番号
+        :return: None
+        """
+        task = asyncio.ensure_future(self.worker(number))
+        task.add_done_callback(lambda done: self.on_worker_done(number, done))
+        self.workers[number] = task
+
+    def on_worker_done(self, number: int, task: Task) -> None:
+        """ ワーカー終了コールバック
+        キャンセル以外で終了したワーカーを再起動する
+
+        :param number: ワーカー番号
+        :param task: 終了したワーカー
+        :return: None
+        """
+        del self.workers[number]
+        if task.cancelled():
+            return
+        logger.error(f'Synthesis worker ({number}) stopped unexpectedly. Restarting.', exc_info=task.exception())
+        self.start_worker(number)
+
+    def take(self) -> tuple[VoiceSource, asyncio.Future]:
+        """ 合成要求取り出し
+        巡回の先頭のサーバーから1件取り出し、まだ要求が残っていればそのサーバーを巡回の末尾へ回す
+
+        :return: 音声化元と結果返却用Future
+        """
+        guild_id = self.ready.popleft()
+        requests = self.pending[guild_id]
+        request = requests.popleft()
+        if requests:
+            self.ready.append(guild_id)
+        else:
+            del self.pending[guild_id]
+        return request
+
+    def pending_count(self) -> int:
+        """ 合成待ち件数
+
+        :return: ワーカーに割り当てられていない合成要求の件数
+        """
+        return sum(len(requests) for requests in self.pending.values())
+
+    def close(self) -> None:
+        """ 終了処理
+
+        :return: None
+        """
+        self.backend.close()
+
+    async def worker(self, number: int) -> None:
+        """ ワーカー
+        合成要求を1件ずつ取り出し、音声合成バックエンドで音声を生成して結果を返却する
+
+        :param number: ワーカー番号
+        :return: None
+        """
+        logger.debug(f'Synthesis worker ({number}) started.')
         while True:
-            self.play_next_voice.clear()
-            current = await self.voice_que.get()
+            await self.available.acquire()
+            source, future = self.take()
+            if future.done():
+                continue
+            self.busy += 1
+            started = time.perf_counter()
             try:
-                create_wav(current, input_file, output_file)
-                source = discord.FFmpegPCMAudio(output_file)
-                self.voice_channel.guild.voice_client.play(source, after=self.toggle_next_voice)
-                await self.play_next_voice.wait()
-            except:
-                logger.exception('Exception in voice play task.')
-                tb = tb = traceback.format_exc()
-                if self.text_channel:
-                    await error_message(self.text_channel, app.msg.task.e_failed, None, str(sys.exc_info()), tb)
+                audio = await self.backend.render(source)
+                app.metrics.render.observe(time.perf_counter() - started)
+                if not future.done():
+                    future.set_result(audio)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.busy -= 1
+
+    async def synthesize(self, guild_id: int, source: VoiceSource) -> EncodedAudio:
+        """ 音声合成要求
+        合成要求をサーバーの待ち行列に登録し、いずれかのワーカーによる合成の完了を待ち合わせる
+
+        :param guild_id: guild id
+        :param source: 音声化元
+        :return: エンコード済み音声
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        if guild_id not in self.pending:
+            self.pending[guild_id] = deque()
+            self.ready.append(guild_id)
+        self.pending[guild_id].append((source, future))
+        self.available.release()
+        return await future
+
+
+class AhoCorasick:
+    """ 複数語句一括検索オートマトン
+    登録されたすべての語句を、文字列の1回の走査で検索する
+    同じ位置から複数の語句が一致する場合は最長のものを、重なる場合は先に始まるものを優先して置換する
+    """
+
+    def __init__(self, words: dict[str, str]):
+        """ 初期化処理
+        語句のトライ木を作成し、失敗遷移と出力遷移を幅優先で設定する
+
+        :param words: 語句と置換文字列のマップ
+        """
+        self.words = words
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.length: list[int] = [0]
+        self.output: list[int] = [0]
+        for word in words:
+            node = 0
+            for char in word:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.length.append(0)
+                    self.output.append(0)
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.length[node] = len(word)
+
+        que = deque(self.goto[0].values())
+        while que:
+            node = que.popleft()
+            for char, child in self.goto[node].items():
+                que.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(char, 0)
+                parent = self.fail[child]
+                self.output[child] = parent if self.length[parent] else self.output[parent]
+
+    def replace(self, text: str) -> str:
+        """ 置換
+
+        :param text: 変換前文字列
+        :return: 変換後文字列
+        """
+        longest: dict[int, int] = {}
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            matched = node if self.length[node] else self.output[node]
+            while matched:
+                start = position + 1 - self.length[matched]
+                if longest.get(start, 0) < self.length[matched]:
+                    longest[start] = self.length[matched]
+                matched = self.output[matched]
+
+        if not longest:
+            return text
+        replaced = []
+        position = 0
+        while position < len(text):
+            length = longest.get(position)
+            if length:
+                replaced.append(self.words[text[position:position + length]])
+                position += length
+            else:
+                replaced.append(text[position])
+                position += 1
+        return ''.join(replaced)
+
+
+class PronunciationDictionary:
+    """ 読み辞書
+    サーバーごとの語句と読みのマップ
+    語句の変更時には、イベントループを止めないよう別スレッドでオートマトンを再構築し、
+    再構築が終わるまでは変更前のオートマトンで置換を行う
+    """
+
+    def __init__(self, words: dict[str, str] = None):
+        """ 初期化処理
+
+        :param words: 語句と読みのマップ
+        """
+        self.words: dict[str, str] = dict(words or {})
+        self.version = 0
+        self.automaton: AhoCorasick | None = AhoCorasick(dict(self.words)) if self.words else None
+
+    def add(self, word: str, reading: str) -> None:
+        """ 語句登録
+
+        :param word: 語句
+        :param reading: 読み
+        :return: None
+        """
+        self.words[word] = reading
+        self.rebuild()
+
+    def remove(self, word: str) -> bool:
+        """ 語句削除
+
+        :param word: 語句
+        :return: 削除した場合はTrue
+        """
+        if word not in self.words:
+            return False
+        del self.words[word]
+        self.rebuild()
+        return True
+
+    def rebuild(self) -> None:
+        """ オートマトン再構築
+        別スレッドで再構築し、その間に更に変更があった場合は古い結果を破棄する
+
+        :return: None
+        """
+        self.version += 1
+        version = self.version
+        words = dict(self.words)
+
+        def on_built(future: asyncio.Future) -> None:
+            if version == self.version and not future.cancelled() and not future.exception():
+                self.automaton = future.result() if words else None
+
+        asyncio.get_running_loop().run_in_executor(None, AhoCorasick, words).add_done_callback(on_built)
+
+    def replace(self, text: str) -> str:
+        """ 読み置換
+
+        :param text: 変換前文字列
+        :return: 変換後文字列
+        """
+        if self.automaton:
+            return self.automaton.replace(text)
+        return text
+
+
+class SpeakableNormalizer:
+    """ 文字列可読化エンジン
+    有効なすべてのルールを1つの正規表現にまとめてコンパイルしておき、
+    1回の走査ですべての置換を行う
+    """
+
+    def __init__(self, replacements: dict[str, str | None], max_length: int, chunk_length: int):
+        """ 初期化処理
+
+        :param replacements: ルール名と置換文字列のマップ(置換文字列がNoneのルールは無効)
+        :param max_length: 文字数上限
+        :param chunk_length: 1回に音声化する文字数の上限
+        """
+        self.replacements = {rule: text for rule, text in replacements.items() if text is not None}
+        self.max_length = max_length
+        self.chunk_length = chunk_length
+        self.pattern = re.compile('|'.join(
+            f'(?P<{rule}>{pattern})' for rule, pattern in SPEAKABLE_RULES.items() if rule in self.replacements))
+
+    def replace(self, match: re.Match) -> str:
+        """ 置換文字列取得
+
+        :param match: マッチ結果
+        :return: マッチしたルールの置換文字列
+        """
+        return self.replacements[match.lastgroup]
+
+    def normalize(self, text: str, dictionary: PronunciationDictionary = None) -> str:
+        """ 可読化
+        ルールによる置換の後、読み辞書があれば読みの置換を行う
+
+        :param text: 変換前文字列
+        :param dictionary: 読み辞書
+        :return: 変換後文字列
+        """
+        if self.replacements:
+            text = self.pattern.sub(self.replace, text)
+        if dictionary:
+            text = dictionary.replace(text)
+        return text[:self.max_length]
+
+    def split(self, text: str) -> list[str]:
+        """ 分割
+        文の区切りで分割し、上限文字数に収まる範囲で隣り合う文をまとめる
+        上限文字数を超える文は読点などの区切りで、区切りが無ければ上限文字数で分割する
+        改行は区切りとして取り除かれ、改行で区切られた文をまとめる際は間に読点を入れる
+
+        :param text: 可読化済み文字列
+        :return: 分割後文字列のリスト(読み上げる内容が無い場合は空)
+        """
+        chunks = []
+        for sentence in SENTENCE_PATTERN.findall(text):
+            sentence = sentence.strip()
+            while self.chunk_length < len(sentence):
+                cut = max(sentence.rfind(delimiter, 0, self.chunk_length) for delimiter in PHRASE_DELIMITERS) + 1
+                if cut <= 0:
+                    cut = self.chunk_length
+                chunks.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if not sentence:
+                continue
+            separator = COALESCE_SEPARATOR if chunks and chunks[-1][-1] not in SENTENCE_TERMINATORS else ''
+            if chunks and len(chunks[-1]) + len(separator) + len(sentence) <= self.chunk_length:
+                chunks[-1] += separator + sentence
+            else:
+                chunks.append(sentence)
+        return chunks
+
+
+class Histogram:
+    """ ヒストグラム
+    観測値を、上限値ごとの累積件数として集計する(Prometheusのhistogram形式)
+    """
+
+    def __init__(self, buckets: tuple[float, ...]):
+        """ 初期化処理
+
+        :param buckets: 各区間の上限値(昇順)
+        """
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """ 観測
+
+        :param value: 観測値
+        :return: None
+        """
+        self.sum += value
+        self.count += 1
+        for index, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[index] += 1
+
+    def average(self) -> float:
+        """ 平均値
+
+        :return: 観測値の平均(観測が無い場合は0)
+        """
+        return self.sum / self.count if self.count else 0.0
+
+    def render(self, name: str, description: str) -> list[str]:
+        """ Prometheus形式出力
+
+        :param name: メトリクス名
+        :param description: 説明
+        :return: 出力行のリスト
+        """
+        lines = [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for bucket, count in zip(self.buckets, self.counts):
+            lines.append(f'{name}_bucket{{le="{bucket}"}} {count}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum {self.sum}')
+        lines.append(f'{name}_count {self.count}')
+        return lines
+
+
+class Metrics:
+    """ メトリクス
+    動作状態を集計し、Prometheusのテキスト形式で公開する
+    待ち行列の件数などの現在値は、取得要求のたびにアプリケーションの状態から算出する
+    """
+
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    """
+    所要時間ヒストグラムの区間上限(秒)
+    """
+
+    def __init__(self):
+        """ 初期化処理
+        """
+        self.open_jtalk = Histogram(self.LATENCY_BUCKETS)
+        self.encode = Histogram(self.LATENCY_BUCKETS)
+        self.render = Histogram(self.LATENCY_BUCKETS)
+        self.playback_delay = Histogram(self.LATENCY_BUCKETS)
+        self.loop_lag = Histogram(self.LATENCY_BUCKETS)
+        self.loop_stalls = 0
+        self.played = 0
+        self.trimmed_seconds = 0.0
+        self.dropped = 0
+        self.expired = 0
+        self.runner = None
+
+    def cache_hit_ratio(self) -> float:
+        """ 読み上げ音声キャッシュヒット率
+
+        :return: ヒット率(参照が無い場合は0)
+        """
+        lookups = app.audio_cache.hits + app.audio_cache.misses
+        return app.audio_cache.hits / lookups if lookups else 0.0
+
+    def to_text(self) -> str:
+        """ Prometheus形式出力
+
+        :return: 全メトリクスのテキスト
+        """
+        lines = ['# HELP yomiage_queue_depth Number of messages waiting to be read per guild.',
+                 '# TYPE yomiage_queue_depth gauge']
+        total = 0
+        active = 0
+        for guild_id, server_status in app.server_statuses.items():
+            depth = server_status.queue_depth()
+            total += depth
+            lines.append(f'yomiage_queue_depth{{guild="{guild_id}"}} {depth}')
+            if server_status.voice_channel and server_status.voice_channel.guild.voice_client:
+                active += 1
+        pool = app.synthesis_pool
+        lines += [
+            '# HELP yomiage_queue_depth_total Number of messages waiting to be read in all guilds.',
+            '# TYPE yomiage_queue_depth_total gauge',
+            f'yomiage_queue_depth_total {total}',
+            '# HELP yomiage_voice_clients Number of active voice clients.',
+            '# TYPE yomiage_voice_clients gauge',
+            f'yomiage_voice_clients {active}',
+            '# HELP yomiage_synthesis_workers Number of synthesis workers.',
+            '# TYPE yomiage_synthesis_workers gauge',
+            f'yomiage_synthesis_workers {pool.size}',
+            '# HELP yomiage_synthesis_busy Number of synthesis workers currently rendering.',
+            '# TYPE yomiage_synthesis_busy gauge',
+            f'yomiage_synthesis_busy {pool.busy}',
+            '# HELP yomiage_synthesis_pending Number of synthesis requests waiting for a worker.',
+            '# TYPE yomiage_synthesis_pending gauge',
+            f'yomiage_synthesis_pending {pool.pending_count()}',
+            '# HELP yomiage_played_total Audio clips played.',
+            '# TYPE yomiage_played_total counter',
+            f'yomiage_played_total {self.played}',
+            '# HELP yomiage_trimmed_seconds_total Seconds of silence removed from played audio.',
+            '# TYPE yomiage_trimmed_seconds_total counter',
+            f'yomiage_trimmed_seconds_total {self.trimmed_seconds}',
+            '# HELP yomiage_messages_dropped_total Messages dropped by queue overflow.',
+            '# TYPE yomiage_messages_dropped_total counter',
+            f'yomiage_messages_dropped_total {self.dropped}',
+            '# HELP yomiage_messages_expired_total Messages discarded after waiting too long.',
+            '# TYPE yomiage_messages_expired_total counter',
+            f'yomiage_messages_expired_total {self.expired}',
+            '# HELP yomiage_audio_cache_hits_total Audio cache hits.',
+            '# TYPE yomiage_audio_cache_hits_total counter',
+            f'yomiage_audio_cache_hits_total {app.audio_cache.hits}',
+            '# HELP yomiage_audio_cache_misses_total Audio cache misses.',
+            '# TYPE yomiage_audio_cache_misses_total counter',
+            f'yomiage_audio_cache_misses_total {app.audio_cache.misses}',
+            '# HELP yomiage_audio_cache_evictions_total Audio cache evictions.',
+            '# TYPE yomiage_audio_cache_evictions_total counter',
+            f'yomiage_audio_cache_evictions_total {app.audio_cache.evictions}',
+            '# HELP yomiage_audio_cache_hit_ratio Audio cache hit ratio.',
+            '# TYPE yomiage_audio_cache_hit_ratio gauge',
+            f'yomiage_audio_cache_hit_ratio {self.cache_hit_ratio()}',
+            '# HELP yomiage_audio_cache_bytes Bytes held by the audio cache.',
+            '# TYPE yomiage_audio_cache_bytes gauge',
+            f'yomiage_audio_cache_bytes {app.audio_cache.size}',
+        ]
+        if app.audio_store:
+            lines += [
+                '# HELP yomiage_audio_store_hits_total Disk audio store hits.',
+                '# TYPE yomiage_audio_store_hits_total counter',
+                f'yomiage_audio_store_hits_total {app.audio_store.hits}',
+                '# HELP yomiage_audio_store_misses_total Disk audio store misses.',
+                '# TYPE yomiage_audio_store_misses_total counter',
+                f'yomiage_audio_store_misses_total {app.audio_store.misses}',
+                '# HELP yomiage_audio_store_bytes Size of the current disk audio store pack file.',
+                '# TYPE yomiage_audio_store_bytes gauge',
+                f'yomiage_audio_store_bytes {app.audio_store.end}',
+            ]
+        lines += self.open_jtalk.render('yomiage_open_jtalk_seconds', 'Time spent running open_jtalk.')
+        lines += self.encode.render('yomiage_encode_seconds', 'Time spent encoding audio to Opus.')
+        lines += self.render.render('yomiage_render_seconds', 'Time spent in the synthesis backend per request.')
+        lines += self.playback_delay.render(
+            'yomiage_playback_delay_seconds', 'Time from receiving a message to starting its playback.')
+        lines += self.loop_lag.render('yomiage_event_loop_lag_seconds', 'Event loop scheduling lag.')
+        lines += [
+            '# HELP yomiage_event_loop_stalls_total Times the event loop was blocked beyond the threshold.',
+            '# TYPE yomiage_event_loop_stalls_total counter',
+            f'yomiage_event_loop_stalls_total {self.loop_stalls}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    async def handle(self, request: 'web.Request') -> 'web.Response':
+        """ メトリクス取得要求
+
+        :param request: リクエスト
+        :return: Prometheus形式のメトリクス
+        """
+        from aiohttp import web
+        return web.Response(text=self.to_text(), content_type='text/plain', charset='utf-8')
+
+    async def start(self, host: str, port: int) -> None:
+        """ メトリクス公開開始
+        HTTPサーバーを起動し、/metricsでメトリクスを公開する(起動済みの場合は何もしない)
+
+        :param host: 待ち受けアドレス
+        :param port: 待ち受けポート
+        :return: None
+        """
+        if self.runner:
+            return
+        from aiohttp import web
+        server = web.Application()
+        server.add_routes([web.get('/metrics', self.handle)])
+        self.runner = web.AppRunner(server)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        logger.info(f'Metrics available at (http://{host}:{port}/metrics).')
+
+
+class LoopWatchdog:
+    """ イベントループ監視
+    一定間隔で起床するタスクの遅れから、イベントループのスケジューリング遅延を計測する
+    別スレッドから遅延を監視し、閾値を超えてブロックされている間のスタックを、実行中のタスク名とともにログに出力する
+    同じスレッドから、時間を区切ったサンプリングプロファイルも取得できる
+    """
+
+    IDLE_FRAMES = {('selectors.py', 'select'), ('windows_events.py', '_poll')}
+    """
+    イベントループが待機中であることを示すフレーム(ファイル名, 関数名)
+    """
+
+    def __init__(self, interval: float, threshold: float):
+        """ 初期化処理
+
+        :param interval: 計測間隔(秒)
+        :param threshold: ブロックとみなす遅延(秒)
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.loop: asyncio.AbstractEventLoop = None
+        self.thread_id = 0
+        self.beat = time.monotonic()
+        self.stalled = False
+        self.profiling = False
+        self.task: Task = None
+
+    def start(self) -> None:
+        """ 監視開始
+        実行中のイベントループの監視を開始する(開始済みの場合は何もしない)
+
+        :return: None
+        """
+        if self.task:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.beat = time.monotonic()
+        self.task = asyncio.ensure_future(self.heartbeat_task())
+        threading.Thread(target=self.watch, name='yomiage-watchdog', daemon=True).start()
+        logger.info(f'Event loop watchdog started (threshold: {self.threshold}s).')
+
+    async def heartbeat_task(self) -> None:
+        """ 遅延計測タスク
+
+        :return: None
+        """
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.beat = time.monotonic()
+            app.metrics.loop_lag.observe(max(0.0, self.beat - started - self.interval))
+
+    def current_task_name(self) -> str:
+        """ 実行中タスク名取得
+        監視スレッドから、イベントループで実行中のタスクとコルーチンの名前を取得する
+
+        :return: タスク名
+        """
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            return 'no task (callback)'
+        coro = task.get_coro()
+        return f'{task.get_name()}: {getattr(coro, "__qualname__", coro)}'
+
+    def watch(self) -> None:
+        """ 監視スレッド
+        ブロックを検知した場合、1回のブロックにつき1度だけスタックをログに出力する
+
+        :return: None
+        """
+        while True:
+            time.sleep(self.interval)
+            lag = time.monotonic() - self.beat - self.interval
+            if lag < self.threshold:
+                self.stalled = False
+                continue
+            if self.stalled:
+                continue
+            self.stalled = True
+            app.metrics.loop_stalls += 1
+            frame = sys._current_frames().get(self.thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame else ''
+            logger.warning(f'Event loop blocked for ({lag:.2f})s while running ({self.current_task_name()}).\n{stack}')
+
+    def profile(self, duration: float, interval: float = 0.005) -> tuple[int, int, Counter]:
+        """ サンプリングプロファイル
+        指定時間の間、イベントループのスレッドで実行中の行を一定間隔で記録する
+        呼び出し元をブロックするため、executorで実行すること
+
+        :param duration: 計測時間(秒)
+        :param interval: 記録間隔(秒)
+        :return: 記録数・うち待機中の記録数・実行中の行ごとの記録数
+        """
+        samples = 0
+        idle = 0
+        hot_spots = Counter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame:
+                samples += 1
+                code = frame.f_code
+                file_name = os.path.basename(code.co_filename)
+                if (file_name, code.co_name) in self.IDLE_FRAMES:
+                    idle += 1
+                else:
+                    hot_spots[f'{code.co_name} ({file_name}:{frame.f_lineno})'] += 1
+            time.sleep(interval)
+        return samples, idle, hot_spots
+
+
+class StartupTimer:
+    """ 起動計測
+    起動から各段階が完了するまでの時間を記録する
+    ログ出力の準備が整うまでは記録のみ行い、report以降は記録と同時にログに出力する
+    """
+
+    def __init__(self, origin: float):
+        """ 初期化処理
+
+        :param origin: 起動時刻(time.perf_counter)
+        """
+        self.origin = origin
+        self.phases: dict[str, float] = {}
+        self.reported = False
+
+    def mark(self, phase: str) -> None:
+        """ 段階完了記録
+        同じ段階は最初の1回のみ記録する
+
+        :param phase: 段階名
+        :return: None
+        """
+        if phase in self.phases:
+            return
+        self.phases[phase] = time.perf_counter() - self.origin
+        if self.reported:
+            logger.info(f'Startup phase ({phase}) finished at ({self.phases[phase]:.3f})s.')
+
+    def report(self) -> None:
+        """ 記録出力
+        それまでに完了した各段階の、起動からの時間と前の段階からの時間をログに出力する
+
+        :return: None
+        """
+        if self.reported:
+            return
+        self.reported = True
+        previous = 0.0
+        for phase, elapsed in self.phases.items():
+            logger.info(f'Startup phase ({phase}) finished at ({elapsed:.3f})s (+{elapsed - previous:.3f}s).')
+            previous = elapsed
 
 
 class Color:
@@ -172,6 +2006,22 @@ class JoinMsg:
     w_nothing_to_do: str
 
 
+class ChAddMsg:
+    """ ch_addコマンドメッセージ設定保持クラス
+    """
+    s_added: str
+    w_already_added: str
+    e_not_joined: str
+
+
+class ChDelMsg:
+    """ ch_delコマンドメッセージ設定保持クラス
+    """
+    s_deleted: str
+    e_not_found: str
+    e_last_channel: str
+
+
 class ByeMsg:
     """ byeコマンドメッセージ設定保持クラス
     """
@@ -192,6 +2042,14 @@ class SVoiceMsg:
     e_arg_not_valid: str
 
 
+class SRateMsg:
+    """ s_rateコマンドメッセージ設定保持クラス
+    """
+    s_rate_changed: str
+    s_rate_disabled: str
+    e_arg_not_valid: str
+
+
 class VoiceMsg:
     """ voiceコマンドメッセージ設定保持クラス
     """
@@ -199,38 +2057,368 @@ class VoiceMsg:
     e_arg_not_valid: str
 
 
-class TaskMsg:
-    """ taskメッセージ設定保持クラス
-    """
-    e_failed: str
+class SkipMsg:
+    """ skipコマンドメッセージ設定保持クラス
+    """
+    s_skipped: str
+    e_not_playing: str
+
+
+class ClearMsg:
+    """ clearコマンドメッセージ設定保持クラス
+    """
+    s_cleared: str
+    e_not_joined: str
+
+
+class DictAddMsg:
+    """ dict_addコマンドメッセージ設定保持クラス
+    """
+    s_added: str
+
+
+class DictDelMsg:
+    """ dict_delコマンドメッセージ設定保持クラス
+    """
+    s_deleted: str
+    e_not_found: str
+
+
+class DictListMsg:
+    """ dict_listコマンドメッセージ設定保持クラス
+    """
+    s_list: str
+    w_empty: str
+
+
+class ProfileMsg:
+    """ profileコマンドメッセージ設定保持クラス
+    """
+    s_result: str
+    w_idle: str
+    e_running: str
+
+
+class IdleMsg:
+    """ 自動終了メッセージ設定保持クラス
+    """
+    s_left_empty: str
+    s_left_silent: str
+
+
+class TaskMsg:
+    """ taskメッセージ設定保持クラス
+    """
+    e_failed: str
+
+
+class CommandMsg:
+    """ commandメッセージ設定保持クラス
+    """
+    e_not_found: str
+    e_failed: str
+
+
+class Msg:
+    """ メッセージ設定保持クラス
+    """
+    common: CommonMsg = CommonMsg()
+    join: JoinMsg = JoinMsg()
+    bye: ByeMsg = ByeMsg()
+    ch_add: ChAddMsg = ChAddMsg()
+    ch_del: ChDelMsg = ChDelMsg()
+    s_prefix: SPrefixMsg = SPrefixMsg()
+    s_voice: SVoiceMsg = SVoiceMsg()
+    s_rate: SRateMsg = SRateMsg()
+    voice: VoiceMsg = VoiceMsg()
+    skip: SkipMsg = SkipMsg()
+    clear: ClearMsg = ClearMsg()
+    dict_add: DictAddMsg = DictAddMsg()
+    dict_del: DictDelMsg = DictDelMsg()
+    dict_list: DictListMsg = DictListMsg()
+    profile: ProfileMsg = ProfileMsg()
+    idle: IdleMsg = IdleMsg()
+    task: TaskMsg = TaskMsg()
+    command: CommandMsg = CommandMsg()
+
+
+@dataclass
+class ServerConfig:
+    """ サーバー個別設定保持クラス
+    プレフィックス・声質・読み上げ速度が変更された場合は、versionを更新して継承後設定の再計算を促す
+    """
+    cmd_prefix: str = None
+    voice_type: str = None
+    rate_min: float = None
+    rate_max: float = None
+    target_latency: float = None
+    users: dict[int, UserConfig] = field(default_factory=dict)
+    dictionary: PronunciationDictionary = field(default_factory=lambda: PronunciationDictionary())
+    version: int = 0
+
+
+class ResolvedServer:
+    """ 継承後サーバー設定
+    ルート<サーバー個別<ユーザー個別設定を継承した結果を保持するクラス
+    ユーザー個別設定を持たないユーザーの声質はサーバーの声質とするため、
+    usersには個別設定を持つユーザーのみを保持する
+    """
+    __slots__ = ('version', 'cmd_prefix', 'voice_type', 'rate', 'users')
+
+    def __init__(self, version: int, cmd_prefix: str, voice_type: str, rate: tuple[float, float, float],
+                 users: dict[int, str]):
+        self.version = version
+        self.cmd_prefix = cmd_prefix
+        self.voice_type = voice_type
+        self.rate = rate
+        self.users = users
+
+
+class ResolvedSettings:
+    """ 継承後設定索引
+    メッセージ受信のたびに設定の継承を計算しないよう、サーバーごとの継承後設定を保持する
+    サーバー個別設定のversionが変わっていた場合のみ再計算する
+    """
+
+    def __init__(self):
+        """ 初期化処理
+        """
+        self.servers: dict[int, ResolvedServer] = {}
+        self.prefix_heads: set[str] = set()
+
+    def add_prefix(self, prefix: str) -> None:
+        """ コマンドプレフィックス登録
+        コマンドの可能性がある投稿を1回の集合の参照で判定できるよう、プレフィックスの先頭文字を記録する
+        変更前のプレフィックスの先頭文字は削除しない(判定が緩くなるだけで、誤ってコマンドを無視することはない)
+
+        :param prefix: コマンドプレフィックス
+        :return: None
+        """
+        if prefix:
+            self.prefix_heads.add(prefix[0])
+
+    def may_be_command(self, content: str) -> bool:
+        """ コマンド判定
+        いずれかのサーバーのコマンドプレフィックスの先頭文字で始まる投稿かを判定する
+
+        :param content: 投稿内容
+        :return: コマンドの可能性があればTrue
+        """
+        return bool(content) and content[0] in self.prefix_heads
+
+    def resolve(self, guild_id: int) -> ResolvedServer:
+        """ 継承後サーバー設定取得
+
+        :param guild_id: guild id
+        :return: 継承後サーバー設定
+        """
+        server_config = app.server_configs.get(guild_id)
+        version = server_config.version if server_config else -1
+        resolved = self.servers.get(guild_id)
+        if resolved is None or resolved.version != version:
+            voice_type = get_layered_server_voice_type(guild_id)
+            users = {}
+            if server_config:
+                users = {user_id: user.voice_type for user_id, user in server_config.users.items() if user.voice_type}
+            resolved = ResolvedServer(
+                version, get_layered_server_cmd_prefix(guild_id), voice_type, get_layered_server_rate(guild_id), users)
+            self.servers[guild_id] = resolved
+        return resolved
+
+    def prefix(self, guild_id: int) -> str:
+        """ コマンドプレフィックス取得
+
+        :param guild_id: guild id
+        :return: コマンドプレフィックス
+        """
+        return self.resolve(guild_id).cmd_prefix
+
+    def voice_type(self, guild_id: int, user_id: int) -> str:
+        """ ユーザー声質取得
+
+        :param guild_id: guild id
+        :param user_id: user id
+        :return: 声質
+        """
+        resolved = self.resolve(guild_id)
+        return resolved.users.get(user_id, resolved.voice_type)
+
+    def rate(self, guild_id: int) -> tuple[float, float, float]:
+        """ 読み上げ速度設定取得
+
+        :param guild_id: guild id
+        :return: 最低速度・最高速度・目標遅延(秒)
+        """
+        return self.resolve(guild_id).rate
+
+
+class SettingsStore:
+    """ 設定永続化ストア
+    サーバー個別設定・ユーザー個別設定・読み辞書をSQLiteに保存する
+    読み込みはサーバーごとに必要になった時点で行い、以降はメモリ上の設定を使用する
+    変更は即座には書き込まず、変更のあったサーバーを記録しておき、一定間隔でまとめて書き込む
+    SQLiteへのアクセスは専用のスレッドで行うため、コマンド処理がディスクI/Oを待つことはない
+    """
+
+    def __init__(self, path: str, flush_interval: float):
+        """ 初期化処理
+
+        :param path: データベースファイルのパス
+        :param flush_interval: 書き込み間隔(秒)
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='settings')
+        self.connection: sqlite3.Connection = None
+        self.dirty: set[int] = set()
+        self.task: Task = None
+
+    def connect(self) -> sqlite3.Connection:
+        """ 接続
+        初回呼び出し時に接続し、テーブルが無ければ作成する
+        専用スレッドからのみ呼び出される
+
+        :return: 接続
+        """
+        if not self.connection:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS servers (
+                    guild_id INTEGER PRIMARY KEY,
+                    cmd_prefix TEXT,
+                    voice_type TEXT,
+                    rate_min REAL,
+                    rate_max REAL,
+                    target_latency REAL);
+                CREATE TABLE IF NOT EXISTS users (
+                    guild_id INTEGER,
+                    user_id INTEGER,
+                    name TEXT,
+                    voice_type TEXT,
+                    PRIMARY KEY (guild_id, user_id));
+                CREATE TABLE IF NOT EXISTS words (
+                    guild_id INTEGER,
+                    word TEXT,
+                    reading TEXT,
+                    PRIMARY KEY (guild_id, word));
+            """)
+            # 読み上げ速度設定が追加される前に作成されたファイルには、列を追加する
+            columns = {row[1] for row in self.connection.execute('PRAGMA table_info(servers)')}
+            for column in ('rate_min', 'rate_max', 'target_latency'):
+                if column not in columns:
+                    self.connection.execute(f'ALTER TABLE servers ADD COLUMN {column} REAL')
+        return self.connection
+
+    def read(self, guild_id: int) -> ServerConfig:
+        """ 読み込み(専用スレッド)
+
+        :param guild_id: guild id
+        :return: サーバー個別設定
+        """
+        connection = self.connect()
+        server_config = ServerConfig()
+        row = connection.execute(
+            'SELECT cmd_prefix, voice_type, rate_min, rate_max, target_latency FROM servers WHERE guild_id = ?',
+            (guild_id,)).fetchone()
+        if row:
+            (server_config.cmd_prefix, server_config.voice_type,
+             server_config.rate_min, server_config.rate_max, server_config.target_latency) = row
+        for user_id, name, voice_type in connection.execute(
+                'SELECT user_id, name, voice_type FROM users WHERE guild_id = ?', (guild_id,)):
+            server_config.users[user_id] = UserConfig(user_id, name, voice_type)
+        words = dict(connection.execute('SELECT word, reading FROM words WHERE guild_id = ?', (guild_id,)))
+        server_config.dictionary = PronunciationDictionary(words)
+        return server_config
+
+    def write(self, snapshots: dict[int, tuple]) -> None:
+        """ 書き込み(専用スレッド)
+        変更のあったサーバーの設定を、1トランザクションでまとめて書き込む
+
+        :param snapshots: guild idと設定のスナップショットのマップ
+        :return: None
+        """
+        connection = self.connect()
+        with connection:
+            for guild_id, (cmd_prefix, voice_type, rate, users, words) in snapshots.items():
+                connection.execute(
+                    'INSERT OR REPLACE INTO servers (guild_id, cmd_prefix, voice_type, rate_min, rate_max, target_latency) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (guild_id, cmd_prefix, voice_type, *rate))
+                connection.execute('DELETE FROM users WHERE guild_id = ?', (guild_id,))
+                connection.executemany(
+                    'INSERT INTO users (guild_id, user_id, name, voice_type) VALUES (?, ?, ?, ?)',
+                    [(guild_id, *user) for user in users])
+                connection.execute('DELETE FROM words WHERE guild_id = ?', (guild_id,))
+                connection.executemany(
+                    'INSERT INTO words (guild_id, word, reading) VALUES (?, ?, ?)',
+                    [(guild_id, *word) for word in words])
+
+    async def load(self, guild_id: int) -> ServerConfig:
+        """ サーバー個別設定読み込み
+
+        :param guild_id: guild id
+        :return: サーバー個別設定
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.read, guild_id)
 
+    def mark_dirty(self, guild_id: int) -> None:
+        """ 変更記録
+        サーバーの設定に変更があったことを記録し、次回の書き込み対象とする
 
-class CommandMsg:
-    """ commandメッセージ設定保持クラス
-    """
-    e_not_found: str
-    e_failed: str
+        :param guild_id: guild id
+        :return: None
+        """
+        self.dirty.add(guild_id)
+        if not self.task or self.task.done():
+            self.task = asyncio.ensure_future(self.flush_task())
 
+    def take_snapshots(self) -> dict[int, tuple]:
+        """ スナップショット取得
+        変更のあったサーバーの設定を書き込み用にコピーし、変更記録をクリアする
 
-class Msg:
-    """ メッセージ設定保持クラス
-    """
-    common: CommonMsg = CommonMsg()
-    join: JoinMsg = JoinMsg()
-    bye: ByeMsg = ByeMsg()
-    s_prefix: SPrefixMsg = SPrefixMsg()
-    s_voice: SVoiceMsg = SVoiceMsg()
-    voice: VoiceMsg = VoiceMsg()
-    task: TaskMsg = TaskMsg()
-    command: CommandMsg = CommandMsg()
+        :return: guild idと設定のスナップショットのマップ
+        """
+        snapshots = {}
+        for guild_id in self.dirty:
+            if guild_id in app.server_configs:
+                server_config = app.server_configs[guild_id]
+                snapshots[guild_id] = (
+                    server_config.cmd_prefix,
+                    server_config.voice_type,
+                    (server_config.rate_min, server_config.rate_max, server_config.target_latency),
+                    [(user.id, user.name, user.voice_type) for user in server_config.users.values()],
+                    list(server_config.dictionary.words.items()))
+        self.dirty.clear()
+        return snapshots
+
+    async def flush_task(self) -> None:
+        """ 書き込みタスク
+        変更が記録されてから一定時間待ち、その間の変更をまとめて書き込む
+        書き込みに失敗した場合や、書き込み中に変更があった場合は、次の書き込みを予約する
 
+        :return: None
+        """
+        await asyncio.sleep(self.flush_interval)
+        snapshots = self.take_snapshots()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.write, snapshots)
+        except:
+            logger.exception('Failed to write settings.')
+            self.dirty.update(snapshots)
+        if self.dirty:
+            self.task = asyncio.ensure_future(self.flush_task())
+
+    def close(self) -> None:
+        """ 終了処理
+        書き込まれていない変更を書き込み、接続を閉じる
 
-class ServerConfig:
-    """ サーバー個別設定保持クラス
-    """
-    cmd_prefix: str = None
-    voice_type: str = None
-    users: dict[int, UserConfig] = {}
+        :return: None
+        """
+        if self.dirty:
+            self.executor.submit(self.write, self.take_snapshots()).result()
+        if self.connection:
+            self.executor.submit(self.connection.close).result()
+        self.executor.shutdown()
 
 
 class Yomiage:
@@ -240,10 +2428,39 @@ class Yomiage:
     token: str
     cmd_prefix: str
     voice_type: str
+    rate: tuple[float, float, float]
+    rate_truncate: bool
+    idle_empty_timeout: float
+    idle_silent_timeout: float
+    idle_check_interval: float
+    reaper: Task = None
+    shard_count: int
+    shard_ids: list[int]
     color: Color = Color()
     msg: Msg = Msg()
     server_configs: dict[int, ServerConfig] = {}
     server_statuses: dict[int, YomiageStatus] = {}
+    synthesis_pool: SynthesisPool
+    synthesis_server: dict
+    synthesis_backend: str
+    lookahead: int
+    audio_cache: AudioCache
+    audio_store: DiskAudioStore | None
+    prewarm_phrases: list[str]
+    post_process: PostProcess
+    queue_max_depth: int
+    queue_overflow: str
+    queue_max_age: float
+    coalesce: Coalesce = Coalesce()
+    normalizer: SpeakableNormalizer
+    settings: SettingsStore
+    resolved: ResolvedSettings = ResolvedSettings()
+    routes: dict[int, YomiageStatus] = {}
+    metrics: Metrics = Metrics()
+    metrics_server: dict
+    watchdog: LoopWatchdog
+    watchdog_enabled: bool
+    profile_max_seconds: float
 
     def __init__(self):
         """ 初期化処理
@@ -253,16 +2470,24 @@ class Yomiage:
             引数で指定があればそのパスを設定ファイルとして読み込む
             指定が無い場合は、config.ymlを設定ファイルとして読み込む
             設定ファイルが存在しない場合はエラーとする
+            --で始まる引数は、設定ファイルのパスとはみなさない
         ・ロガー初期化
             読み込んだ設定ファイルでロガーを初期化する
+        ・設定永続化ストアの設定
+        ・文字列可読化ルールの設定
+        ・音声合成ワーカー数、プロセス数、リモート音声合成、先読み数、キャッシュの設定
+        ・事前生成する文字列、音声後処理の設定
+        ・メトリクス公開、自動終了の設定
+        ・読み上げ待ち行列の上限件数、溢れ時の動作、上限待ち時間、連続投稿まとめの設定
         ・環境変数の設定
             外部.exeの実行に必要となる
         ・コーデック読み込み
         """
         print(get_logo())
         print('Initializing application...')
-        if 1 < len(sys.argv):
-            config_path = os.path.abspath(sys.argv[1])
+        args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+        if args:
+            config_path = os.path.abspath(args[0])
         else:
             config_path = os.path.abspath('config.yml')
 
@@ -276,6 +2501,9 @@ class Yomiage:
 
                 self.token = config_dict['app']['token']
                 self.cmd_prefix = config_dict['app']['cmd_prefix']
+                self.resolved.add_prefix(self.cmd_prefix)
+                self.shard_count = config_dict['app'].get('shard_count') or 0
+                self.shard_ids = config_dict['app'].get('shard_ids') or None
                 vt = config_dict['app']['voice_type']
                 if vt in VOICE_TYPES:
                     self.voice_type = vt
@@ -303,6 +2531,16 @@ class Yomiage:
                 self.msg.bye.s_yomiage_stopped = config_dict['msg']['bye']['s_yomiage_stopped']
                 self.msg.bye.e_bot_not_in_vc = config_dict['msg']['bye']['e_bot_not_in_vc']
 
+                # Msg ChAdd
+                self.msg.ch_add.s_added = config_dict['msg']['ch_add']['s_added']
+                self.msg.ch_add.w_already_added = config_dict['msg']['ch_add']['w_already_added']
+                self.msg.ch_add.e_not_joined = config_dict['msg']['ch_add']['e_not_joined']
+
+                # Msg ChDel
+                self.msg.ch_del.s_deleted = config_dict['msg']['ch_del']['s_deleted']
+                self.msg.ch_del.e_not_found = config_dict['msg']['ch_del']['e_not_found']
+                self.msg.ch_del.e_last_channel = config_dict['msg']['ch_del']['e_last_channel']
+
                 # Msg SPrefix
                 self.msg.s_prefix.s_prefix_changed = config_dict['msg']['s_prefix']['s_prefix_changed']
 
@@ -310,10 +2548,43 @@ class Yomiage:
                 self.msg.s_voice.s_voice_changed = config_dict['msg']['s_voice']['s_voice_changed']
                 self.msg.s_voice.e_arg_not_valid = config_dict['msg']['s_voice']['e_arg_not_valid']
 
+                # Msg SRate
+                self.msg.s_rate.s_rate_changed = config_dict['msg']['s_rate']['s_rate_changed']
+                self.msg.s_rate.s_rate_disabled = config_dict['msg']['s_rate']['s_rate_disabled']
+                self.msg.s_rate.e_arg_not_valid = config_dict['msg']['s_rate']['e_arg_not_valid']
+
                 # Msg Voice
                 self.msg.voice.s_voice_changed = config_dict['msg']['voice']['s_voice_changed']
                 self.msg.voice.e_arg_not_valid = config_dict['msg']['voice']['e_arg_not_valid']
 
+                # Msg Skip
+                self.msg.skip.s_skipped = config_dict['msg']['skip']['s_skipped']
+                self.msg.skip.e_not_playing = config_dict['msg']['skip']['e_not_playing']
+
+                # Msg Clear
+                self.msg.clear.s_cleared = config_dict['msg']['clear']['s_cleared']
+                self.msg.clear.e_not_joined = config_dict['msg']['clear']['e_not_joined']
+
+                # Msg DictAdd
+                self.msg.dict_add.s_added = config_dict['msg']['dict_add']['s_added']
+
+                # Msg DictDel
+                self.msg.dict_del.s_deleted = config_dict['msg']['dict_del']['s_deleted']
+                self.msg.dict_del.e_not_found = config_dict['msg']['dict_del']['e_not_found']
+
+                # Msg DictList
+                self.msg.dict_list.s_list = config_dict['msg']['dict_list']['s_list']
+                self.msg.dict_list.w_empty = config_dict['msg']['dict_list']['w_empty']
+
+                # Msg Profile
+                self.msg.profile.s_result = config_dict['msg']['profile']['s_result']
+                self.msg.profile.w_idle = config_dict['msg']['profile']['w_idle']
+                self.msg.profile.e_running = config_dict['msg']['profile']['e_running']
+
+                # Msg Idle
+                self.msg.idle.s_left_empty = config_dict['msg']['idle']['s_left_empty']
+                self.msg.idle.s_left_silent = config_dict['msg']['idle']['s_left_silent']
+
                 # Msg Task
                 self.msg.task.e_failed = config_dict['msg']['task']['e_failed']
 
@@ -321,12 +2592,130 @@ class Yomiage:
                 self.msg.command.e_not_found = config_dict['msg']['command']['e_not_found']
                 self.msg.command.e_failed = config_dict['msg']['command']['e_failed']
 
+                # 音声合成設定
+                synthesis = config_dict.get('synthesis') or {}
+                workers = synthesis.get('workers') or os.cpu_count() or 1
+                timeout = synthesis.get('timeout', 30)
+                remote = synthesis.get('remote') or {}
+                self.synthesis_server = synthesis.get('server') or {}
+                self.synthesis_backend = synthesis.get('backend') or 'auto'
+                resident_available = importlib.util.find_spec('pyopenjtalk') is not None
+                if self.synthesis_backend == 'auto':
+                    self.synthesis_backend = 'resident' if resident_available else 'open_jtalk'
+                elif self.synthesis_backend == 'resident' and not resident_available:
+                    logger.warning('pyopenjtalk is not installed. Using open_jtalk instead.')
+                    self.synthesis_backend = 'open_jtalk'
+                if self.synthesis_backend == 'fake':
+                    backend = FakeSynthesisBackend(synthesis.get('fake_latency', 0.1))
+                elif self.synthesis_backend == 'resident':
+                    backend = ProcessPoolBackend(
+                        synthesis.get('processes') or os.cpu_count() or 1, timeout, True,
+                        synthesis.get('resident_dictionary') or '')
+                elif synthesis.get('processes'):
+                    backend = ProcessPoolBackend(synthesis['processes'], timeout)
+                else:
+                    backend = OpenJTalkBackend()
+                if remote.get('urls') and self.synthesis_backend != 'fake':
+                    backend = RemoteSynthesisBackend(
+                        remote['urls'],
+                        remote.get('timeout', 10),
+                        remote.get('health_interval', 10),
+                        remote.get('connections', 8),
+                        backend)
+                self.synthesis_pool = SynthesisPool(workers, timeout, backend)
+                self.lookahead = max(1, synthesis.get('lookahead', 2))
+                self.audio_cache = AudioCache(synthesis.get('cache_size_mb', 32) * 1024 * 1024)
+                disk_cache = synthesis.get('disk_cache') or {}
+                self.audio_store = None
+                if disk_cache.get('size_mb', 256):
+                    self.audio_store = DiskAudioStore(
+                        os.path.abspath(disk_cache.get('path', 'audio_cache')), disk_cache.get('size_mb', 256) * 1024 * 1024)
+
+                # 事前生成設定
+                phrases = synthesis.get('prewarm')
+                if phrases is None:
+                    phrases = [text for text in SPEAKABLE_REPLACEMENTS.values() if text] + [OMITTED_TEXT]
+                self.prewarm_phrases = [str(phrase) for phrase in phrases]
+
+                # 音声後処理設定
+                processing = synthesis.get('post_process') or {}
+                self.post_process = PostProcess(
+                    processing.get('enabled', False),
+                    processing.get('trim_threshold', -45.0),
+                    processing.get('trim_margin', 0.05),
+                    processing.get('target_level'),
+                    processing.get('gains') or {},
+                    processing.get('limiter', True),
+                    processing.get('ceiling', -1.0))
+
+                # 設定永続化ストア
+                settings = config_dict.get('settings') or {}
+                self.settings = SettingsStore(
+                    os.path.abspath(settings.get('path', 'yomiage.db')), settings.get('flush_interval', 5))
+
+                # 文字列可読化設定
+                speakable = config_dict.get('speakable') or {}
+                replacements = dict(SPEAKABLE_REPLACEMENTS)
+                replacements.update(speakable.get('rules') or {})
+                for rule in list(replacements):
+                    if rule not in SPEAKABLE_RULES:
+                        logger.warning(f'Speakable rule ({rule}) does not exist. Ignored.')
+                        del replacements[rule]
+                self.normalizer = SpeakableNormalizer(
+                    replacements, speakable.get('max_length', 100), max(1, speakable.get('chunk_length', 30)))
+
+                # メトリクス設定
+                self.metrics_server = config_dict.get('metrics') or {}
+
+                # イベントループ監視設定
+                watchdog = config_dict.get('watchdog') or {}
+                self.watchdog_enabled = watchdog.get('enabled', True)
+                self.watchdog = LoopWatchdog(watchdog.get('interval', 0.1), watchdog.get('threshold', 0.5))
+                self.profile_max_seconds = watchdog.get('profile_max_seconds', 30)
+
+                # 読み上げ速度自動調整設定
+                adaptive_rate = config_dict.get('adaptive_rate') or {}
+                self.rate = (
+                    adaptive_rate.get('rate_min', 1.0),
+                    adaptive_rate.get('rate_max', 1.5),
+                    adaptive_rate.get('target_latency', 0))
+                self.rate_truncate = adaptive_rate.get('truncate', True)
+
+                # 自動終了設定
+                idle = config_dict.get('idle') or {}
+                self.idle_empty_timeout = idle.get('empty_timeout', 60)
+                self.idle_silent_timeout = idle.get('silent_timeout', 1800)
+                self.idle_check_interval = idle.get('check_interval', 30)
+
+                # 読み上げ待ち行列設定
+                queue = config_dict.get('queue') or {}
+                self.queue_max_depth = queue.get('max_depth', 20)
+                self.queue_overflow = queue.get('overflow', 'drop_oldest')
+                if self.queue_overflow not in OVERFLOW_POLICIES:
+                    logger.warning(f'Overflow policy ({self.queue_overflow}) does not exist. Replaced to (drop_oldest).')
+                    self.queue_overflow = 'drop_oldest'
+                self.queue_max_age = queue.get('max_age', 60)
+
+                # 連続投稿まとめ設定
+                coalesce = queue.get('coalesce') or {}
+                self.coalesce.enabled = coalesce.get('enabled', False)
+                self.coalesce.key = coalesce.get('key', 'user')
+                if self.coalesce.key not in COALESCE_KEYS:
+                    logger.warning(f'Coalesce key ({self.coalesce.key}) does not exist. Replaced to (user).')
+                    self.coalesce.key = 'user'
+                self.coalesce.window = coalesce.get('window', 3)
+                self.coalesce.max_length = coalesce.get('max_length', 40)
+
         # バイナリディレクトリにパスを通す(コマンド実行に必要)
         os.environ["PATH"] += os.pathsep + os.path.join(root_path(), 'resource')
 
+        startup.mark('config')
+
         # opus(コーデック)読み込み
-        if not discord.opus.is_loaded():
+        # 疑似音声合成バックエンドはエンコードを行わないため、読み込まない
+        if self.synthesis_backend != 'fake' and not discord.opus.is_loaded():
             discord.opus.load_opus(resource_path('libopus.dll'))
+        startup.mark('opus load')
 
 
 class JapaneseHelpCommand(commands.DefaultHelpCommand):
@@ -342,6 +2731,7 @@ class JapaneseHelpCommand(commands.DefaultHelpCommand):
 
 app: Yomiage
 logger: Logger
+startup: StartupTimer = StartupTimer(STARTED_AT)
 
 
 def root_path() -> str:
@@ -367,54 +2757,396 @@ def resource_path(relative_path: str) -> str:
     return os.path.join(root_path(), 'resource', relative_path)
 
 
-def make_speakable(text: str) -> str:
+def make_speakable(text: str, dictionary: PronunciationDictionary = None) -> str:
     """ 文字列可読化
     文字列を読み上げ可能な状態へ加工して返却する
+    加工内容はapp.normalizerのルールと、サーバーの読み辞書に従う
 
     :param text: 変換前文字列
+    :param dictionary: 読み辞書
     :return: 変換後文字列
     """
-    # 2行目以降の削除
-    text = text.split(BACK_SLASH)[0]
-    # メンションの削除
-    text = re.sub(r'@\d{18}', '', text)
-    # URLの置換
-    text = re.sub(r"https?://[\w/:%#$&?()~.=+\-]+", 'ゆーあーるえる', text)
-    # 5桁以上の数字の置換
-    text = re.sub(r'\d{5,}', 'たくさん', text)
-    # 絵文字の削除
-    text = re.sub(r'<:\w+:\d+>', '', text)
-    # 文字数上限２０
-    text = text[:20]
+    return app.normalizer.normalize(text, dictionary)
 
-    return text
 
+def format_speed(rate: float) -> str:
+    """ 発声のスピード文字列化
+    読み上げ音声キャッシュのキーにも使用するため、ローカルでの音声合成と音声合成サーバーで同じ形式にする
 
-def create_wav(source: VoiceSource, input_file: str, output_file: str) -> None:
-    """ 読み上げ音声ファイル生成
-    open_jtalkを使用し、文字列から読み上げ音声ファイルを生成する
-
-    :param input_file:
-    :param output_file:
-    :param source: キュー
-    :return: None
+    :param rate: 発声のスピード
+    :return: 発声のスピード(小数第1位まで)
     """
+    return f'{rate:.1f}'
+
 
-    with open(input_file, 'w', encoding='shift_jis') as file:
-        file.write(source.text)
+def open_jtalk_command(voice_type: str, speed: str, output_file: str) -> list[str]:
+    """ open_jtalkコマンド生成
 
+    :param voice_type: 声質
+    :param speed: 発声のスピード
+    :param output_file: 出力ファイル名
+    :return: コマンドと引数のリスト
+    """
     args = {
         'x': resource_path('dic'),  # 辞書のPath
-        'm': resource_path(f'htsvoice\\{VOICE_TYPES[source.user_config.voice_type]}'),  # ボイスファイルのPath
-        'r': '1.0',  # 発声のスピード
+        'm': resource_path(f'htsvoice\\{VOICE_TYPES[voice_type]}'),  # ボイスファイルのPath
+        'r': speed,  # 発声のスピード
         'ow': output_file,  # 出力ファイル名
-        'input_file': input_file  # 入力ファイル名
     }
+    return ['open_jtalk.exe', '-x', args['x'], '-m', args['m'], '-r', args['r'], '-ow', args['ow']]
+
+
+async def create_wav(source: VoiceSource) -> bytes:
+    """ 読み上げ音声生成
+    open_jtalkを使用し、文字列から読み上げ音声(WAV)を生成する
+    open_jtalkは非同期サブプロセスとして実行するため、合成中もイベントループは停止しない
+    SynthesisPoolのワーカーから呼び出される
+    文字列は標準入力で渡す
+    open_jtalkは標準出力へWAVを書き出せないため、出力はOSの一時ディレクトリに書き出し、
+    読み込み後すぐに削除する(resourceディレクトリは使用しない)
+
+    :param source: キュー
+    :return: WAVデータ
+    """
+    fd, output_file = tempfile.mkstemp(prefix='yomiage_', suffix='.wav')
+    os.close(fd)
+    try:
+        cmd = open_jtalk_command(source.voice_type, source.speed, output_file)
+        logger.debug(f'Execute open_jtalk command ({" ".join(cmd)})')
+
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.PIPE)
+        try:
+            await asyncio.wait_for(
+                process.communicate(source.text.encode('shift_jis', errors='ignore')), app.synthesis_pool.timeout)
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+            raise
+
+        app.metrics.open_jtalk.observe(time.perf_counter() - started)
+        if process.returncode != 0:
+            raise RuntimeError(f'open_jtalk exited with code ({process.returncode}).')
+
+        with open(output_file, 'rb') as file:
+            return file.read()
+    finally:
+        os.remove(output_file)
+
+
+def load_numpy() -> bool:
+    """ NumPy読み込み
+    初回呼び出し時にのみ読み込みを行う
+
+    :return: 利用可能であればTrue
+    """
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+    return numpy is not False
+
+
+def post_process(pcm: bytes, channels: int, rate: int, voice_type: str,
+                 processing: PostProcess) -> tuple[bytes, float]:
+    """ 音声後処理
+    16bitのPCMデータに対して、以下の処理をNumPyでまとめて行う
+    ・前後の無音の除去(10ms単位の平均エネルギーが閾値以下の区間)
+    ・音量の正規化(発声区間の実効値を目標値に合わせ、声質ごとの補正を加える)
+    ・リミッター(上限を超える区間とその前後だけ音量を抑え、それ以外の区間の音量は変えない)
+    無音の除去はバッファを複製せずに参照範囲を狭めるだけで行い、音量の変更が必要な場合のみ作業用のバッファを確保する
+
+    :param pcm: PCMデータ(16bit)
+    :param channels: チャンネル数
+    :param rate: サンプリングレート
+    :param voice_type: 声質
+    :param processing: 後処理設定
+    :return: 処理後のPCMデータ・除去した無音の長さ(秒)
+    """
+    samples = numpy.frombuffer(pcm, dtype='<i2')
+    window = rate // 100 * channels
+    blocks = len(samples) // window
+    if not blocks:
+        return pcm, 0.0
+
+    # 10ms単位の平均エネルギー
+    view = samples[:blocks * window].reshape(blocks, window)
+    energy = numpy.einsum('ij,ij->i', view, view, dtype=numpy.float64) / window
+    voiced = numpy.flatnonzero(energy > (32768 * 10 ** (processing.trim_threshold / 20)) ** 2)
+    if not len(voiced):
+        return pcm, 0.0
+
+    margin = int(processing.trim_margin * 100)
+    start = max(voiced[0] - margin, 0) * window
+    end = min((voiced[-1] + 1 + margin) * window, len(samples))
+    trimmed = (len(samples) - (end - start)) / channels / rate
+    samples = samples[start:end]
+
+    gain = 10 ** (processing.gains.get(voice_type, 0.0) / 20)
+    if processing.target_level is not None:
+        rms = float(numpy.sqrt(energy[voiced].mean()))
+        gain *= 32768 * 10 ** (processing.target_level / 20) / rms
+    ceiling = 32767 * 10 ** (processing.ceiling / 20)
+    limit = processing.limiter and ceiling < max(int(samples.max()), -int(samples.min())) * gain
+    if abs(gain - 1.0) < 0.01 and not limit:
+        return samples.tobytes(), trimmed
+
+    work = samples.astype(numpy.float32)
+    work *= gain
+    if limit:
+        work *= limiter_envelope(work, window, ceiling)
+    numpy.clip(work, -32768, 32767, out=work)
+    return work.astype('<i2').tobytes(), trimmed
+
+
+def limiter_envelope(work: 'numpy.ndarray', window: int, ceiling: float) -> 'numpy.ndarray':
+    """ リミッターの音量変化計算
+    区間(10ms)ごとに、ピークを上限に収めるのに必要な倍率を求め、前後LIMITER_RELEASE区間のうち最小の倍率を取る
+    これを区間の中央どうしで線形補間するため、上限を超える区間の手前から滑らかに音量を下げ、過ぎたあと滑らかに戻す
+    補間した倍率は、どのサンプルでもそのサンプルの属する区間に必要な倍率以下になる
+
+    :param work: 音量変更後のサンプル
+    :param window: 区間のサンプル数
+    :param ceiling: ピークの上限
+    :return: サンプルごとの倍率
+    """
+    starts = numpy.arange(0, len(work), window)
+    peaks = numpy.maximum.reduceat(numpy.abs(work), starts)
+    needed = numpy.minimum(ceiling / numpy.maximum(peaks, 1.0), 1.0)
+    padded = numpy.pad(needed, LIMITER_RELEASE, mode='edge')
+    envelope = numpy.lib.stride_tricks.sliding_window_view(padded, LIMITER_RELEASE * 2 + 1).min(axis=1)
+    centers = numpy.minimum(starts + window / 2, len(work) - 1)
+    return numpy.interp(numpy.arange(len(work)), centers, envelope).astype(numpy.float32)
+
+
+def decode_wav(audio: bytes, voice_type: str = '', processing: PostProcess = None) -> tuple[bytes, float]:
+    """ WAVデコード
+    WAVデータを、discordの再生形式(48kHz・16bit・ステレオのPCM)へ変換する
+    後処理が有効で、NumPyが利用可能な場合は、変換の途中で後処理を行う
+
+    :param audio: WAVデータ
+    :param voice_type: 声質
+    :param processing: 後処理設定
+    :return: PCMデータ・後処理で除去した無音の長さ(秒)
+    """
+    with wave.open(io.BytesIO(audio)) as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        pcm = wav.readframes(wav.getnframes())
+
+    if width != 2:
+        pcm = audioop.lin2lin(pcm, width, 2)
+    trimmed = 0.0
+    if processing and processing.enabled and load_numpy():
+        pcm, trimmed = post_process(pcm, channels, rate, voice_type, processing)
+    if rate != discord.opus.Encoder.SAMPLING_RATE:
+        pcm, _ = audioop.ratecv(pcm, 2, channels, rate, discord.opus.Encoder.SAMPLING_RATE, None)
+    if channels == 1:
+        pcm = audioop.tostereo(pcm, 2, 1, 1)
+    return pcm, trimmed
+
+
+def encode_opus(pcm: bytes, trimmed: float = 0.0) -> EncodedAudio:
+    """ Opusエンコード
+    PCMデータを20ms単位に分割し、Opusフレームへエンコードする
+    最後のフレームが20msに満たない場合は、無音で埋めてエンコードする
+
+    :param pcm: PCMデータ(48kHz・16bit・ステレオ)
+    :param trimmed: 後処理で除去した無音の長さ(秒)
+    :return: エンコード済み音声
+    """
+    encoder = discord.opus.Encoder()
+    frame_size = discord.opus.Encoder.FRAME_SIZE
+    remainder = len(pcm) % frame_size
+    if remainder:
+        pcm += bytes(frame_size - remainder)
+    view = memoryview(pcm)
+    return EncodedAudio(tuple(
+        encoder.encode(view[offset:offset + frame_size].tobytes(), discord.opus.Encoder.SAMPLES_PER_FRAME)
+        for offset in range(0, len(pcm), frame_size)), trimmed)
+
+
+def encode_wav(audio: bytes, voice_type: str = '', processing: PostProcess = None) -> EncodedAudio:
+    """ WAVエンコード
+    WAVデータをdiscordの再生形式へ変換し、Opusフレームへエンコードする
+
+    :param audio: WAVデータ
+    :param voice_type: 声質
+    :param processing: 後処理設定
+    :return: エンコード済み音声
+    """
+    return encode_opus(*decode_wav(audio, voice_type, processing))
+
+
+def init_synthesis_process(resident: bool = False, dictionary: str = '') -> None:
+    """ 音声合成プロセス初期化
+    プロセスプールの各プロセスの起動時に実行される
+    コーデックを読み込み、常駐エンジンを使用する場合は常駐音声合成エンジンを読み込む
+    常駐音声合成エンジンを読み込めなかった(辞書が無いなど)場合は、このプロセスではopen_jtalkで音声合成を行う
+
+    :param resident: 常駐エンジンを使用する場合はTrue
+    :param dictionary: 常駐エンジンの辞書のディレクトリ
+    :return: None
+    """
+    global engine
+    if not discord.opus.is_loaded():
+        discord.opus.load_opus(resource_path('libopus.dll'))
+    if resident and engine is None:
+        try:
+            engine = ResidentEngine(dictionary)
+        except Exception:
+            # プロセス内ではloggerが初期化されていないため、名前で取得する
+            logging.getLogger('yomiage').exception('Failed to load resident engine. Using open_jtalk instead.')
+
+
+def render_in_process(text: str, voice_type: str, speed: str, timeout: float,
+                      processing: PostProcess = None) -> EncodedAudio:
+    """ 読み上げ音声生成(プロセスプール用)
+    プロセスプールの各プロセス内で、常駐音声合成エンジン(読み込んでいない場合はopen_jtalk)による音声合成と
+    Opusエンコードを行う
+    プロセス内ではappとloggerが初期化されていないため、参照しない
+
+    :param text: 文字列
+    :param voice_type: 声質
+    :param speed: 発声のスピード
+    :param timeout: タイムアウト(秒)
+    :param processing: 後処理設定
+    :return: エンコード済み音声
+    """
+    if engine:
+        return encode_wav(engine.synthesize(text, voice_type, speed), voice_type, processing)
+
+    fd, output_file = tempfile.mkstemp(prefix='yomiage_', suffix='.wav')
+    os.close(fd)
+    try:
+        subprocess.run(
+            open_jtalk_command(voice_type, speed, output_file),
+            input=text.encode('shift_jis', errors='ignore'), timeout=timeout, check=True)
+        with open(output_file, 'rb') as file:
+            wav = file.read()
+    finally:
+        os.remove(output_file)
+    return encode_wav(wav, voice_type, processing)
+
+
+async def render_wav(guild_id: int, source: VoiceSource) -> EncodedAudio:
+    """ 読み上げ音声生成
+    読み上げ音声キャッシュにヒットした場合は、音声合成を行わずにキャッシュの音声を返却する
+    ヒットしない場合はディスクキャッシュを参照し、それにもヒットしない場合はSynthesisPoolで音声を生成して、
+    両方のキャッシュに登録して返却する
+
+    :param guild_id: guild id
+    :param source: キュー
+    :return: エンコード済み音声
+    """
+    key = AudioCache.key_of(source)
+    audio = app.audio_cache.get(key)
+    if audio is not None:
+        logger.debug(f'Audio cache hit ({source.text}).')
+        return audio
+
+    if app.audio_store:
+        audio = await app.audio_store.get(key)
+        if audio is not None:
+            logger.debug(f'Audio store hit ({source.text}).')
+            app.audio_cache.put(key, audio)
+            return audio
+
+    audio = await app.synthesis_pool.synthesize(guild_id, source)
+    app.audio_cache.put(key, audio)
+    if app.audio_store:
+        app.audio_store.put(key, audio)
+    startup.mark('first synthesis')
+    return audio
+
+
+async def prewarm() -> None:
+    """ 事前準備
+    ボットのログインと並行して、最初の読み上げで発生する準備処理を先に済ませる
+    ・ディスクキャッシュの索引の読み込み
+    ・音声後処理に使用するNumPyの読み込み
+    ・よく使われる文字列の音声合成(音声合成エンジンの辞書・プロセスの準備を兼ねる)
+    生成した音声は読み上げ音声キャッシュに登録される
+
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    if app.audio_store:
+        await app.audio_store.load()
+    if app.post_process.enabled and not await loop.run_in_executor(None, load_numpy):
+        logger.warning('numpy is not installed. Audio post processing is disabled.')
+
+    if not app.prewarm_phrases:
+        return
+    started = time.perf_counter()
+    speed = format_speed(app.rate[0])
+    results = await asyncio.gather(
+        *(render_wav(0, VoiceSource(0, app.voice_type, phrase, speed)) for phrase in app.prewarm_phrases),
+        return_exceptions=True)
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        logger.warning(f'Failed to prewarm ({len(failed)}) phrases: {failed[0]!r}')
+    startup.mark('prewarm')
+    logger.info(f'Prewarmed ({len(results) - len(failed)}/{len(results)}) phrases '
+                f'in ({time.perf_counter() - started:.2f})s.')
+
+
+async def leave(guild_id: int, voice_client: VoiceClient | None) -> YomiageStatus | None:
+    """ 読み上げ終了
+    サーバーの読み上げ待ち行列と先読み中の音声を破棄し、再生タスクを停止して、ボイスチャンネルから切断する
+    byeコマンドと、自動終了で共用する
 
-    cmd = 'open_jtalk.exe -x {x} -m {m} -r {r} -ow {ow} {input_file}'.format(**args)
-    logger.debug(f'Execute open_jtalk command ({cmd})')
+    :param guild_id: guild id
+    :param voice_client: 接続中のボイスクライアント
+    :return: 終了したサーバー(読み上げ中でなかった場合はNone)
+    """
+    server_status = app.server_statuses.pop(guild_id, None)
+    if server_status:
+        server_status.unwatch_all()
+        server_status.clear()
+        if server_status.task:
+            server_status.task.cancel()
+    if voice_client and voice_client.is_connected():
+        await voice_client.disconnect()
+    return server_status
+
+
+async def idle_reaper_task() -> None:
+    """ 自動終了タスク
+    一定間隔で全サーバーを確認し、以下のいずれかに該当するサーバーの読み上げを終了する
+    ・ボイスチャンネルにボット以外のユーザーがいない状態が、一定時間続いた
+    ・読み上げる投稿が無い状態が、一定時間続いた
+    読み上げを終了したことは、読み上げ中のテキストチャンネルに通知する
 
-    subprocess.run(cmd)
+    :return: None
+    """
+    while True:
+        await asyncio.sleep(app.idle_check_interval)
+        now = time.monotonic()
+        for guild_id, server_status in list(app.server_statuses.items()):
+            if (app.idle_empty_timeout and server_status.empty_since is not None
+                    and app.idle_empty_timeout <= now - server_status.empty_since):
+                text = app.msg.idle.s_left_empty
+            elif app.idle_silent_timeout and app.idle_silent_timeout <= now - server_status.last_active:
+                text = app.msg.idle.s_left_silent
+            else:
+                continue
+            logger.info(f'Leaving idle guild ({guild_id}).')
+            try:
+                await leave(guild_id, server_status.voice_channel.guild.voice_client)
+                await success_message(server_status.text_channel, text, {
+                    'text_channel': server_status.text_channel.name,
+                    'voice_channel': server_status.voice_channel.name
+                })
+            except Exception:
+                # 1つのサーバーの失敗で、全サーバーの自動終了が止まらないようにする
+                # 切断に失敗した場合も、次回以降に同じ失敗を繰り返さないよう、読み上げは終了させる
+                logger.exception(f'Failed to leave idle guild ({guild_id}).')
+                if guild_id in app.server_statuses:
+                    await leave(guild_id, None)
 
 
 async def success_message(ctx: Context, text: str, text_param: dict[str, str]) -> None:
@@ -488,6 +3220,22 @@ async def error_message(ctx, text: str, text_param: dict[str, str], error_text:
         await ctx.send(embed=embed)
 
 
+async def load_server_config(guild_id: int) -> ServerConfig:
+    """ サーバー設定取得
+    未読み込みのサーバーは、保存されたサーバー設定を読み込む(一度読み込んだサーバーは再読み込みしない)
+    Guild接続・参加のイベントより先にコマンドが届いた場合にも、保存された設定を上書きしないよう、コマンドからも呼び出す
+
+    :param guild_id: guild id
+    :return: サーバー設定
+    """
+    if guild_id not in app.server_configs:
+        server_config = await app.settings.load(guild_id)
+        if guild_id not in app.server_configs:
+            app.server_configs[guild_id] = server_config
+            app.resolved.add_prefix(server_config.cmd_prefix)
+    return app.server_configs[guild_id]
+
+
 def get_layered_server_cmd_prefix(guild_id: int) -> str:
     """ サーバーコマンドプレフィックス取得
     ルート<サーバー個別設定の優先順位で設定を取得
@@ -518,6 +3266,21 @@ def get_layered_server_voice_type(guild_id: int) -> str:
     return voice_type
 
 
+def get_layered_server_rate(guild_id: int) -> tuple[float, float, float]:
+    """ サーバー読み上げ速度設定取得
+    ルート<サーバー個別設定の優先順位で設定を取得
+
+    :param guild_id: guild id
+    :return: 最低速度・最高速度・目標遅延(秒)
+    """
+    rate = app.rate
+    if guild_id in app.server_configs:
+        server_config = app.server_configs[guild_id]
+        if server_config.target_latency is not None:
+            rate = (server_config.rate_min, server_config.rate_max, server_config.target_latency)
+    return rate
+
+
 def get_layered_user_voice_type(guild_id: int, user_id: int) -> str:
     """ ユーザー声質取得
     ルート<サーバー個別<ユーザー個別設定の優先順位で設定を取得
@@ -538,6 +3301,105 @@ def get_layered_user_voice_type(guild_id: int, user_id: int) -> str:
     return voice_type
 
 
+async def enqueue_message(message: Message) -> None:
+    """ 読み上げ登録
+    コマンド以外の文字列かつ読み上げ対象であれば、読み上げ待ち行列に登録する
+    on_messageから呼び出される(負荷試験では直接呼び出される)
+
+    :param message: メッセージ
+    :return: None
+    """
+    while True:
+        server_status = app.routes.get(message.channel.id)
+        if not server_status:
+            logger.debug(f'Received message from unwatched channel.')
+            break
+        if message.author.bot:
+            logger.debug('Ignored message from bot.')
+            break
+        if not server_status.voice_channel:
+            logger.debug(f'Not Joined')
+            break
+        if message.content.startswith(app.resolved.prefix(message.guild.id)):
+            logger.debug(f'Ignored starting with command prefix.')
+            break
+
+        bot_vc_cl = message.guild.voice_client
+        if not bot_vc_cl:
+            logger.debug(f'Has no Voice Client.')
+            break
+
+        logger.info(f'Received message from user ({message.author.id}/{message.author.name}).')
+        logger.debug(f'Raw message content ({message.content.replace(BACK_SLASH, "/")})')
+        server_config = app.server_configs.get(message.guild.id)
+        text_for_speak = make_speakable(message.content, server_config.dictionary if server_config else None)
+        logger.debug(f'Converted message content ({text_for_speak})')
+
+        source = VoiceSource(
+            message.author.id, app.resolved.voice_type(message.guild.id, message.author.id), text_for_speak)
+        await server_status.voice_que.put(source)
+        break
+
+
+async def handle_health(request: 'web.Request') -> 'web.Response':
+    """ 音声合成サーバー ヘルスチェック
+
+    :param request: リクエスト
+    :return: ワーカー数と合成中の数
+    """
+    from aiohttp import web
+    return web.json_response({
+        'workers': app.synthesis_pool.size,
+        'busy': app.synthesis_pool.busy
+    })
+
+
+async def handle_synthesize(request: 'web.Request') -> 'web.Response':
+    """ 音声合成サーバー 音声合成
+    JSON({text, voice_type, speed})を受け取り、EncodedAudio.to_bytesで直列化した音声を返却する
+    リモートの各ボットを公平に扱うため、送信元アドレスごとに合成の順番を巡回させる
+
+    :param request: リクエスト
+    :return: 直列化したエンコード済み音声
+    """
+    from aiohttp import web
+    try:
+        body = await request.json()
+        text = str(body['text'])[:app.synthesis_server.get('max_length', 200)]
+        voice_type = body['voice_type']
+        speed = format_speed(float(body.get('speed', 1.0)))
+    except (ValueError, KeyError, TypeError):
+        raise web.HTTPBadRequest(text='Invalid synthesis request.')
+    if voice_type not in VOICE_TYPES:
+        raise web.HTTPBadRequest(text=f'Voice Type ({voice_type}) does not exist.')
+
+    source = VoiceSource(0, voice_type, text, speed)
+    audio = await render_wav(hash(request.remote), source)
+    return web.Response(body=audio.to_bytes(), content_type='application/octet-stream')
+
+
+def run_synthesis_server() -> None:
+    """ 音声合成サーバー起動
+    --synthesis-server引数付きで起動された場合に、ボットの代わりに起動する
+    他のyomiageからの音声合成依頼を、HTTPで受け付ける
+
+    :return: None
+    """
+    from aiohttp import web
+    server = web.Application()
+    server.add_routes([
+        web.get('/health', handle_health),
+        web.post('/synthesize', handle_synthesize),
+    ])
+    host = app.synthesis_server.get('host', '127.0.0.1')
+    port = app.synthesis_server.get('port', 8765)
+    logger.info(f'Synthesis server listening on ({host}:{port}).')
+    try:
+        web.run_app(server, host=host, port=port, print=None)
+    finally:
+        app.synthesis_pool.close()
+
+
 async def determine_prefix(bot, message) -> str:
     """ プレフィックス判定コールバック
     discord.pyがサーバのプレフィクスを判断するためのコールバック
@@ -546,33 +3408,81 @@ async def determine_prefix(bot, message) -> str:
     :param message: message
     :return: コマンドプレフィックス
     """
-    return get_layered_server_cmd_prefix(message.guild.id)
+    return app.resolved.prefix(message.guild.id)
 
 
 if __name__ == '__main__':
-    app = Yomiage()
+    multiprocessing.freeze_support()
+    startup.mark('import')
+    # 設定の読み込み中にもログを出力するため、appより先に取得する
     logger = logging.getLogger('yomiage')
-    client = commands.Bot(command_prefix=determine_prefix, help_command=JapaneseHelpCommand())
+    app = Yomiage()
+    if '--synthesis-server' in sys.argv:
+        run_synthesis_server()
+        sys.exit(0)
+    if app.shard_count:
+        client = commands.AutoShardedBot(
+            command_prefix=determine_prefix,
+            help_command=JapaneseHelpCommand(),
+            shard_count=app.shard_count,
+            shard_ids=app.shard_ids)
+    else:
+        client = commands.Bot(command_prefix=determine_prefix, help_command=JapaneseHelpCommand())
+
+
+    @client.event
+    async def on_connect() -> None:
+        """ ゲートウェイ接続
+        ログインが完了し、ゲートウェイに接続した際に実行される
+        """
+        startup.mark('login')
+
+
+    @client.event
+    async def on_voice_state_update(member, before, after) -> None:
+        """ ボイス状態変化
+        ユーザーのボイスチャンネルへの参加・退出などの際に実行される
+        読み上げ中のボイスチャンネルが無人になった時刻を記録する(一定時間後にidle_reaper_taskが読み上げを終了する)
+        ボット自身が切断された場合(管理者による切断など)は、即座に読み上げを終了する
+        (このイベントの時点では、ボイスクライアントの後始末がまだ済んでいない場合がある)
+        """
+        server_status = app.server_statuses.get(member.guild.id)
+        if not server_status:
+            return
+        if member.id == client.user.id:
+            if after.channel is None:
+                logger.info(f'Disconnected from voice channel in guild ({member.guild.id}).')
+                await leave(member.guild.id, member.guild.voice_client)
+                return
+            server_status.voice_channel = after.channel
+        server_status.update_listeners()
 
 
     @client.event
     async def on_guild_available(guild) -> None:
         """ Guild接続
         Guildが利用可能となった際に実行される
-        サーバー設定クラスインスタンスを作成する
+        保存されたサーバー設定を読み込む(一度読み込んだサーバーは再読み込みしない)
+        """
+        await load_server_config(guild.id)
+
+
+    @client.event
+    async def on_guild_join(guild) -> None:
+        """ Guild参加
+        ボットがGuildに参加した際に実行される
+        以前に参加していたサーバーであれば、保存されたサーバー設定を読み込む
         """
-        if guild.id not in app.server_configs:
-            app.server_configs[guild.id] = ServerConfig()
+        await load_server_config(guild.id)
 
 
     @client.event
     async def on_guild_unavailable(guild) -> None:
         """ Guild切断
-        Guildが利用可能となった際に実行される
-        サーバー設定クラスインスタンスを破棄する
+        Guildが利用不可となった際に実行される
+        一時的な障害である可能性があるため、サーバー設定は破棄せずに保持する
         """
-        if guild.id in app.server_configs:
-            del app.server_configs[guild.id]
+        logger.warning(f'Guild ({guild.id}) became unavailable.')
 
 
     @client.event
@@ -587,7 +3497,17 @@ if __name__ == '__main__':
         logger.info(f'cmd_prefix: {app.cmd_prefix}')
         logger.info(f'voice_type: {app.voice_type} ({VOICE_TYPES[app.voice_type]})')
         logger.info(f'bot_user: {client.user.id}/{client.user.name}')
+        if app.shard_count:
+            logger.info(f'shards: {app.shard_ids or "all"} of {app.shard_count}')
         logger.info('==========================================================')
+        if app.watchdog_enabled:
+            app.watchdog.start()
+        if app.reaper is None:
+            app.reaper = asyncio.ensure_future(idle_reaper_task())
+        if app.metrics_server.get('enabled'):
+            await app.metrics.start(app.metrics_server.get('host', '127.0.0.1'), app.metrics_server.get('port', 9100))
+        startup.mark('first ready')
+        startup.report()
         logger.info('Application successfully　launched. Now waiting users operation.')
 
 
@@ -638,7 +3558,7 @@ if __name__ == '__main__':
         if bot_vc:
             if bot_vc.id == user_vc.id:
                 server_status = app.server_statuses[ctx.guild.id]
-                if server_status.text_channel.id == ctx.channel.id:
+                if list(server_status.text_channels) == [ctx.channel.id]:
                     logger.warning(f'Nothing to do.')
                     await warning_message(ctx, app.msg.join.w_nothing_to_do, {
                         'cmd_prefix': ctx.prefix,
@@ -652,26 +3572,35 @@ if __name__ == '__main__':
                         'text_channel': ctx.channel.name,
                         'voice_channel': user_vc.name
                     })
-                    server_status.text_channel = ctx.channel
+                    server_status.unwatch_all()
+                    server_status.text_channel = None
+                    server_status.watch(ctx.channel)
+                    server_status.last_active = time.monotonic()
                 return
             else:
-                logger.info(f'Disconnecting from voice channel ({bot_vc.name}).')
-                await bot_vc_cl.disconnect()
-
-        logger.info(f'Connecting users voice channel ({user_vc.name})')
-        await user_vc.connect()
+                # 切断してから接続し直すと、切断のボイス状態変化で読み上げが終了してしまうため、移動する
+                logger.info(f'Moving from voice channel ({bot_vc.name}) to ({user_vc.name}).')
+                await bot_vc_cl.move_to(user_vc)
+        else:
+            logger.info(f'Connecting users voice channel ({user_vc.name})')
+            await user_vc.connect()
 
         if ctx.guild.id in app.server_statuses:
             server_status = app.server_statuses[ctx.guild.id]
             server_status.voice_channel = user_vc
-            server_status.text_channel = ctx.channel
+            server_status.unwatch_all()
+            server_status.text_channel = None
+            server_status.watch(ctx.channel)
+            server_status.last_active = time.monotonic()
+            server_status.empty_since = None
         else:
             server_status = YomiageStatus()
             server_status.id = ctx.guild.id
             server_status.voice_channel = user_vc
-            server_status.text_channel = ctx.channel
+            server_status.watch(ctx.channel)
             server_status.task = client.loop.create_task(server_status.voice_play_task())
             app.server_statuses[ctx.guild.id] = server_status
+        server_status.update_listeners()
 
         await success_message(ctx, app.msg.join.s_yomiage_started, {
             'text_channel': ctx.channel.name,
@@ -693,20 +3622,73 @@ if __name__ == '__main__':
             if bot_vc:
                 logger.info(f'Disconnecting from voice channel ({bot_vc.id}/{bot_vc.name}).')
 
-                await ctx.voice_client.disconnect()
-                if ctx.guild.id in app.server_statuses:
-                    server = app.server_statuses[ctx.guild.id]
-                    server.task.cancel()
+                server = await leave(ctx.guild.id, bot_vc_cl)
+                if server:
                     await success_message(ctx, app.msg.bye.s_yomiage_stopped, {
                         'text_channel': server.text_channel.name,
                         'voice_channel': server.voice_channel.name
                     })
-                    del app.server_statuses[ctx.guild.id]
         else:
             logger.warning(f'Not in voice channel.')
             await error_message(ctx, app.msg.bye.e_bot_not_in_vc, None, None, None)
 
 
+    @client.command()
+    async def ch_add(ctx: Context, channel: TextChannel = None) -> None:
+        """ 読み上げチャンネル追加
+        テキストチャンネル<channel>(省略時はコマンドを実行したチャンネル)への投稿も、読み上げるようにします
+        """
+        logger.info(f'Received [ch_add] cmd from user ({ctx.author.name}).')
+        channel = channel or ctx.channel
+        if ctx.guild.id not in app.server_statuses:
+            logger.warning(f'Not joined.')
+            await error_message(ctx, app.msg.ch_add.e_not_joined, {
+                'cmd_prefix': ctx.prefix
+            }, None, None)
+            return
+
+        server_status = app.server_statuses[ctx.guild.id]
+        if not server_status.watch(channel):
+            logger.warning(f'Text channel ({channel.name}) is already watched.')
+            await warning_message(ctx, app.msg.ch_add.w_already_added, {
+                'text_channel': channel.name
+            })
+            return
+
+        await success_message(ctx, app.msg.ch_add.s_added, {
+            'text_channel': channel.name,
+            'voice_channel': server_status.voice_channel.name
+        })
+
+
+    @client.command()
+    async def ch_del(ctx: Context, channel: TextChannel = None) -> None:
+        """ 読み上げチャンネル削除
+        テキストチャンネル<channel>(省略時はコマンドを実行したチャンネル)への投稿を、読み上げないようにします
+        最後の1つのチャンネルは削除できません(読み上げを終了する場合はbyeコマンドを使用してください)
+        """
+        logger.info(f'Received [ch_del] cmd from user ({ctx.author.name}).')
+        channel = channel or ctx.channel
+        server_status = app.server_statuses.get(ctx.guild.id)
+        if not server_status or channel.id not in server_status.text_channels:
+            logger.warning(f'Text channel ({channel.name}) is not watched.')
+            await error_message(ctx, app.msg.ch_del.e_not_found, {
+                'text_channel': channel.name
+            }, None, None)
+            return
+        if len(server_status.text_channels) == 1:
+            logger.warning(f'Cannot remove the last text channel.')
+            await error_message(ctx, app.msg.ch_del.e_last_channel, {
+                'cmd_prefix': ctx.prefix
+            }, None, None)
+            return
+
+        server_status.unwatch(channel.id)
+        await success_message(ctx, app.msg.ch_del.s_deleted, {
+            'text_channel': channel.name
+        })
+
+
     @client.command()
     @commands.has_permissions(administrator=True)
     async def s_prefix(ctx: Context, arg: str) -> None:
@@ -715,9 +3697,11 @@ if __name__ == '__main__':
         このコマンドはサーバー管理者のみが実行できます
         """
         logger.info(f'Received [s_prefix] cmd from user ({ctx.author.name}).')
-        if ctx.guild.id in app.server_configs:
-            server_config = app.server_configs[ctx.guild.id]
-            server_config.cmd_prefix = arg
+        server_config = await load_server_config(ctx.guild.id)
+        server_config.cmd_prefix = arg
+        server_config.version += 1
+        app.resolved.add_prefix(arg)
+        app.settings.mark_dirty(ctx.guild.id)
 
         await success_message(ctx, app.msg.s_prefix.s_prefix_changed, {
             'cmd_prefix': arg
@@ -755,13 +3739,58 @@ if __name__ == '__main__':
         if arg == 'd':
             arg = ''
 
-        server_config = app.server_configs[ctx.guild.id]
+        server_config = await load_server_config(ctx.guild.id)
         server_config.voice_type = arg
+        server_config.version += 1
+        app.settings.mark_dirty(ctx.guild.id)
 
         await success_message(ctx, app.msg.s_voice.s_voice_changed, {
             'voice_type_name': VOICE_TYPE_NAMES[arg]
         })
 
+    @client.command()
+    @commands.has_permissions(administrator=True)
+    async def s_rate(ctx: Context, rate_min: str, rate_max: str = None, target_latency: str = None) -> None:
+        """ サーバー個別読み上げ速度変更
+        読み上げが遅れたときに、自動的に読み上げ速度を上げるよう設定します
+        読み上げ待ちの時間が<target_latency>秒に近づくほど、速度を<rate_min>倍から<rate_max>倍まで上げます
+        <target_latency>に0を指定すると、速度を<rate_min>倍に固定します
+        このコマンドはサーバー管理者のみが実行できます
+        <rate_min>, <rate_max>に設定可能な値は0.5～3.0です
+        --------------
+        <rate_min>にdを指定するとデフォルトに戻します
+        """
+        logger.info(f'Received [s_rate] cmd from user ({ctx.author.name}).')
+        server_config = await load_server_config(ctx.guild.id)
+        if rate_min == 'd':
+            server_config.rate_min = server_config.rate_max = server_config.target_latency = None
+        else:
+            try:
+                rate = (float(rate_min), float(rate_max), float(target_latency))
+            except (TypeError, ValueError):
+                rate = None
+            if not rate or not 0.5 <= rate[0] <= rate[1] <= 3.0 or rate[2] < 0:
+                await error_message(ctx, app.msg.s_rate.e_arg_not_valid, {
+                    'arg': ' '.join(arg for arg in (rate_min, rate_max, target_latency) if arg),
+                    'cmd_prefix': ctx.prefix
+                }, None, None)
+                return
+            server_config.rate_min, server_config.rate_max, server_config.target_latency = rate
+        server_config.version += 1
+        app.settings.mark_dirty(ctx.guild.id)
+
+        rate_min, rate_max, target_latency = get_layered_server_rate(ctx.guild.id)
+        if not target_latency:
+            await success_message(ctx, app.msg.s_rate.s_rate_disabled, {
+                'rate_min': rate_min
+            })
+            return
+        await success_message(ctx, app.msg.s_rate.s_rate_changed, {
+            'rate_min': rate_min,
+            'rate_max': rate_max,
+            'target_latency': target_latency
+        })
+
     @client.command()
     async def voice(ctx: Context, arg: str) -> None:
         """ ユーザー個別声質変更
@@ -793,7 +3822,7 @@ if __name__ == '__main__':
         if arg == 'd':
             arg = ''
 
-        server_config = app.server_configs[ctx.guild.id]
+        server_config = await load_server_config(ctx.guild.id)
         if ctx.author.id in server_config.users:
             user = server_config.users[ctx.author.id]
             user.id = ctx.author.id
@@ -804,12 +3833,148 @@ if __name__ == '__main__':
                 ctx.author.id,
                 ctx.author.name,
                 arg)
+        server_config.version += 1
+        app.settings.mark_dirty(ctx.guild.id)
 
         await success_message(ctx, app.msg.voice.s_voice_changed, {
             'voice_type_name': VOICE_TYPE_NAMES[arg]
         })
 
 
+    @client.command()
+    async def skip(ctx: Context) -> None:
+        """ 読み上げスキップ
+        読み上げ中の投稿の再生を停止し、次の投稿の読み上げへ進みます
+        """
+        logger.info(f'Received [skip] cmd from user ({ctx.author.name}).')
+        if ctx.guild.id not in app.server_statuses or not app.server_statuses[ctx.guild.id].skip():
+            logger.warning(f'Nothing to skip.')
+            await error_message(ctx, app.msg.skip.e_not_playing, None, None, None)
+            return
+
+        await success_message(ctx, app.msg.skip.s_skipped, None)
+
+
+    @client.command()
+    async def clear(ctx: Context) -> None:
+        """ 読み上げ全削除
+        読み上げ中の投稿の再生を停止し、読み上げ待ちの投稿をすべて削除します
+        """
+        logger.info(f'Received [clear] cmd from user ({ctx.author.name}).')
+        if ctx.guild.id not in app.server_statuses:
+            logger.warning(f'Not joined.')
+            await error_message(ctx, app.msg.clear.e_not_joined, None, None, None)
+            return
+
+        count = app.server_statuses[ctx.guild.id].clear()
+        await success_message(ctx, app.msg.clear.s_cleared, {
+            'count': count
+        })
+
+
+    @client.command()
+    @commands.has_permissions(administrator=True)
+    async def dict_add(ctx: Context, word: str, reading: str) -> None:
+        """ 読み辞書登録
+        サーバーの読み辞書に、語句<word>とその読み<reading>を登録します
+        登録済みの語句の場合は、読みを上書きします
+        このコマンドはサーバー管理者のみが実行できます
+        """
+        logger.info(f'Received [dict_add] cmd from user ({ctx.author.name}).')
+        server_config = await load_server_config(ctx.guild.id)
+        server_config.dictionary.add(word, reading)
+        app.settings.mark_dirty(ctx.guild.id)
+
+        await success_message(ctx, app.msg.dict_add.s_added, {
+            'word': word,
+            'reading': reading
+        })
+
+
+    @client.command()
+    @commands.has_permissions(administrator=True)
+    async def dict_del(ctx: Context, word: str) -> None:
+        """ 読み辞書削除
+        サーバーの読み辞書から、語句<word>を削除します
+        このコマンドはサーバー管理者のみが実行できます
+        """
+        logger.info(f'Received [dict_del] cmd from user ({ctx.author.name}).')
+        server_config = await load_server_config(ctx.guild.id)
+        if not server_config.dictionary.remove(word):
+            logger.warning(f'Word ({word}) does not exist in dictionary.')
+            await error_message(ctx, app.msg.dict_del.e_not_found, {
+                'word': word
+            }, None, None)
+            return
+        app.settings.mark_dirty(ctx.guild.id)
+
+        await success_message(ctx, app.msg.dict_del.s_deleted, {
+            'word': word
+        })
+
+
+    @client.command()
+    async def dict_list(ctx: Context) -> None:
+        """ 読み辞書一覧
+        サーバーの読み辞書に登録されている語句と読みの一覧を表示します
+        """
+        logger.info(f'Received [dict_list] cmd from user ({ctx.author.name}).')
+        words = (await load_server_config(ctx.guild.id)).dictionary.words
+        if not words:
+            await warning_message(ctx, app.msg.dict_list.w_empty, None)
+            return
+
+        lines = [f'{word} → {reading}' for word, reading in sorted(words.items())]
+        listing = ''
+        for index, line in enumerate(lines):
+            if 3500 < len(listing) + len(line):
+                listing += f'…ほか{len(lines) - index}件'
+                break
+            listing += line + BACK_SLASH
+
+        await success_message(ctx, app.msg.dict_list.s_list, {
+            'count': len(words),
+            'words': listing
+        })
+
+
+    @client.command()
+    @commands.has_permissions(administrator=True)
+    async def profile(ctx: Context, seconds: float = 10) -> None:
+        """ プロファイル取得
+        <seconds>秒間(デフォルト10秒)、ボットの処理をサンプリングし、時間のかかっている箇所を表示します
+        このコマンドはサーバー管理者のみが実行できます
+        """
+        logger.info(f'Received [profile] cmd from user ({ctx.author.name}).')
+        if app.watchdog.profiling:
+            logger.warning(f'Profiler already running.')
+            await error_message(ctx, app.msg.profile.e_running, None, None, None)
+            return
+
+        seconds = min(max(seconds, 1), app.profile_max_seconds)
+        app.watchdog.thread_id = threading.get_ident()
+        app.watchdog.profiling = True
+        try:
+            samples, idle, hot_spots = await asyncio.get_running_loop().run_in_executor(
+                None, app.watchdog.profile, seconds)
+        finally:
+            app.watchdog.profiling = False
+        busy = samples - idle
+        logger.info(f'Profiled ({samples}) samples, ({busy}) busy: {hot_spots.most_common(10)}')
+        if not hot_spots:
+            await warning_message(ctx, app.msg.profile.w_idle, {
+                'seconds': seconds
+            })
+            return
+
+        listing = ''.join(f'{count / samples:.1%} {line}{BACK_SLASH}' for line, count in hot_spots.most_common(10))
+        await success_message(ctx, app.msg.profile.s_result, {
+            'seconds': seconds,
+            'busy': f'{busy / samples:.1%}',
+            'hot_spots': listing
+        })
+
+
     @client.command()
     async def s_status(ctx: Context) -> None:
         """ サーバー状態確認
@@ -824,10 +3989,13 @@ if __name__ == '__main__':
 
         text_channel = 'なし'
         voice_channel = 'なし'
+        queue = 'なし'
         if ctx.guild.id in app.server_statuses:
             server_status = app.server_statuses[ctx.guild.id]
-            text_channel = server_status.text_channel.name
+            text_channel = ', '.join(channel.name for channel in server_status.text_channels.values())
             voice_channel = server_status.voice_channel.name
+            queue = (f'{server_status.queue_depth()}件 '
+                     f'(破棄 {server_status.voice_que.dropped}件 / 期限切れ {server_status.expired}件)')
 
         embed.add_field(
             name='TEXT',
@@ -838,6 +4006,17 @@ if __name__ == '__main__':
         embed.add_field(
             name='VC',
             value=voice_channel)
+        embed.add_field(
+            name='QUEUE',
+            value=queue,
+            inline=False)
+        embed.add_field(
+            name='SYNTHESIS',
+            value=f'合成中 {app.synthesis_pool.busy}/{app.synthesis_pool.size} '
+                  f'(待ち {app.synthesis_pool.pending_count()}件) / '
+                  f'キャッシュヒット率 {app.metrics.cache_hit_ratio():.0%} / '
+                  f'平均再生待ち {app.metrics.playback_delay.average():.2f}秒',
+            inline=False)
 
         await ctx.send(embed=embed)
 
@@ -850,12 +4029,10 @@ if __name__ == '__main__':
         logger.info(f'Received [s_config] cmd from user ({ctx.author.name}).')
 
         cmd_prefix = 'デフォルト'
-        voice_type = ''
-        if ctx.guild.id in app.server_configs:
-            server_config = app.server_configs[ctx.guild.id]
-            if server_config.cmd_prefix:
-                cmd_prefix = server_config.cmd_prefix
-            voice_type = server_config.voice_type
+        server_config = await load_server_config(ctx.guild.id)
+        if server_config.cmd_prefix:
+            cmd_prefix = server_config.cmd_prefix
+        voice_type = server_config.voice_type
 
         embed = discord.Embed(
             color=app.color.success,
@@ -870,6 +4047,14 @@ if __name__ == '__main__':
             name='VOICE_TYPE',
             value=f'{VOICE_TYPE_NAMES[voice_type]} ({VOICE_TYPE_NAMES[get_layered_server_voice_type(ctx.guild.id)]})')
 
+        rate = 'デフォルト'
+        if server_config.target_latency is not None:
+            rate = f'{server_config.rate_min}～{server_config.rate_max}倍/{server_config.target_latency}秒'
+        rate_min, rate_max, target_latency = get_layered_server_rate(ctx.guild.id)
+        embed.add_field(
+            name='RATE',
+            value=f'{rate} ({rate_min}～{rate_max}倍/{target_latency}秒)')
+
         await ctx.send(embed=embed)
 
 
@@ -880,10 +4065,9 @@ if __name__ == '__main__':
         """
         logger.info(f'Received [config] cmd from user ({ctx.author.name}).')
         voice_type = ''
-        if ctx.guild.id in app.server_configs:
-            server_config = app.server_configs[ctx.guild.id]
-            if ctx.author.id in server_config.users:
-                voice_type = server_config.users[ctx.author.id].voice_type
+        server_config = await load_server_config(ctx.guild.id)
+        if ctx.author.id in server_config.users:
+            voice_type = server_config.users[ctx.author.id].voice_type
 
         embed = discord.Embed(
             color=app.color.success,
@@ -900,47 +4084,13 @@ if __name__ == '__main__':
     async def on_message(message: Message) -> None:
         """ メッセージ受信
         テキストチャンネルでメッセージが投稿された際に呼び出される
-        コマンド以外の文字列かつ読み上げ対象であれば、音声を再生する
+        コマンド以外の文字列かつ読み上げ対象であれば、読み上げ待ち行列に登録する
+        読み上げ対象外のチャンネルへの、コマンドではありえない投稿は、何もせずに無視する
         """
+        if message.channel.id not in app.routes and not app.resolved.may_be_command(message.content):
+            return
 
-        while True:
-            if message.author.bot:
-                logger.debug('Ignored message from bot.')
-                break
-            if message.guild.id not in app.server_statuses:
-                logger.debug(f'Unknown server id.')
-                break
-
-            server_status = app.server_statuses[message.guild.id]
-            if not server_status.text_channel or not server_status.voice_channel:
-                logger.debug(f'Not Joined')
-                break
-            if server_status.text_channel.id != message.channel.id:
-                logger.debug(f'Received message from other channel.')
-                break
-            if message.content.startswith(get_layered_server_cmd_prefix(message.author.id)):
-                logger.debug(f'Ignored starting with command prefix.')
-                break
-
-            bot_vc_cl = message.guild.voice_client
-            if not bot_vc_cl:
-                logger.debug(f'Has no Voice Client.')
-                break
-
-            logger.info(f'Received message from user ({message.author.id}/{message.author.name}).')
-            logger.debug(f'Raw message content ({message.content.replace(BACK_SLASH, "/")})')
-            text_for_speak = make_speakable(message.content)
-            logger.debug(f'Converted message content ({text_for_speak})')
-
-            source = VoiceSource(text=text_for_speak)
-            user_for_voice = UserConfig()
-            user_for_voice.id = message.author.id
-            user_for_voice.name = message.author.name
-            user_for_voice.voice_type = get_layered_user_voice_type(message.guild.id, message.author.id)
-            source.user_config = user_for_voice
-            await server_status.voice_que.put(source)
-            break
-
+        await enqueue_message(message)
         await client.process_commands(message)
 
 
@@ -971,7 +4121,14 @@ if __name__ == '__main__':
         await error_message(ctx, app.msg.command.e_failed, None, str(orig_error), tb)
 
 
+    # ログインと並行して事前準備を行う
+    client.loop.create_task(prewarm())
     try:
         client.run(app.token)
     except:
         logger.exception('Running client interrupted with exception.')
+    finally:
+        app.settings.close()
+        app.synthesis_pool.close()
+        if app.audio_store:
+            app.audio_store.close()
@@ -0,0 +1,43 @@
+"""
+先読み数の回帰試験
+連続して投稿されても、同時に生成する音声が再生中の1件と先読み数を超えないことを確認する
+"""
+import asyncio
+import os
+
+import loadtest
+import main
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yml')
+
+
+class CountingBackend(loadtest.TaggingBackend):
+    """ 同時生成数計測用疑似音声合成バックエンド
+    同時に生成中の音声の数の最大値を記録する
+    """
+
+    def __init__(self, latency: float, tags: dict[int, str]):
+        super().__init__(latency, tags)
+        self.rendering = 0
+        self.peak = 0
+
+    async def render(self, source: main.VoiceSource) -> main.EncodedAudio:
+        self.rendering += 1
+        self.peak = max(self.peak, self.rendering)
+        try:
+            return await super().render(source)
+        finally:
+            self.rendering -= 1
+
+
+def test_render_does_not_exceed_lookahead():
+    messages = 8
+    harness = loadtest.Harness(1, messages, 0.0)
+    loadtest.load_app(CONFIG_PATH, 0, harness.tags)
+    backend = CountingBackend(0.05, harness.tags)
+    main.app.synthesis_pool = main.SynthesisPool(messages, 30, backend)
+
+    asyncio.run(harness.run(30))
+
+    assert len(harness.latencies) == messages
+    assert backend.peak <= main.app.lookahead + 1
@@ -0,0 +1,98 @@
+"""
+イベントループ停止の回帰試験
+複数サーバーで同時に読み上げを行っても、音声合成の間にイベントループが停止しないことを確認する
+open_jtalkの代わりに、一定時間待機してから無音のWAVを書き出すPythonのサブプロセスを使用する
+"""
+import asyncio
+import os
+import sys
+import time
+import wave
+
+import loadtest
+import main
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yml')
+
+SYNTHESIS_TIME = 0.2
+"""
+疑似open_jtalkの1回の合成にかかる時間(秒)
+"""
+
+MAX_LAG = 0.1
+"""
+許容するイベントループの遅れ(秒)
+音声合成がイベントループを止めていれば、合成1回分(SYNTHESIS_TIME)以上遅れる
+"""
+
+FAKE_OPEN_JTALK = '''
+import sys, time, wave
+sys.stdin.read()
+time.sleep(float(sys.argv[2]))
+with wave.open(sys.argv[1], 'wb') as wav:
+    wav.setnchannels(1)
+    wav.setsampwidth(2)
+    wav.setframerate(48000)
+    wav.writeframes(bytes(48000 // 10 * 2))
+'''
+
+
+def fake_open_jtalk_command(voice_type: str, speed: str, output_file: str) -> list[str]:
+    return [sys.executable, '-c', FAKE_OPEN_JTALK, output_file, str(SYNTHESIS_TIME)]
+
+
+def fake_encode_wav(audio: bytes, voice_type: str = '', processing: main.PostProcess = None) -> main.EncodedAudio:
+    with wave.open(main.io.BytesIO(audio)) as wav:
+        frames = max(1, wav.getnframes() // main.discord.opus.Encoder.SAMPLES_PER_FRAME)
+    return main.EncodedAudio((main.FakeSynthesisBackend.SILENCE_FRAME,) * frames)
+
+
+class TaggingOpenJTalkBackend(main.OpenJTalkBackend):
+    """ 遅延計測用open_jtalk音声合成バックエンド
+    生成した音声と元の文字列を対応付けて記録する
+    """
+
+    def __init__(self, tags: dict[int, str]):
+        self.tags = tags
+
+    async def render(self, source: main.VoiceSource) -> main.EncodedAudio:
+        audio = await super().render(source)
+        self.tags[id(audio)] = source.text
+        return audio
+
+
+async def measure_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """ イベントループの遅れ計測
+
+    :param stop: 計測終了イベント
+    :param interval: 計測間隔(秒)
+    :return: 最大の遅れ(秒)
+    """
+    lag = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(lag, time.perf_counter() - started - interval)
+    return lag
+
+
+def test_synthesis_does_not_stall_event_loop(monkeypatch):
+    guilds = 4
+    messages = 2
+    harness = loadtest.Harness(guilds, messages, 0.01)
+    loadtest.load_app(CONFIG_PATH, 0, harness.tags)
+    monkeypatch.setattr(main, 'open_jtalk_command', fake_open_jtalk_command)
+    monkeypatch.setattr(main, 'encode_wav', fake_encode_wav)
+    main.app.synthesis_pool = main.SynthesisPool(guilds, 30, TaggingOpenJTalkBackend(harness.tags))
+
+    async def run() -> float:
+        stop = asyncio.Event()
+        lag = asyncio.ensure_future(measure_lag(stop))
+        await harness.run(30)
+        stop.set()
+        return await lag
+
+    lag = asyncio.run(run())
+
+    assert len(harness.latencies) == guilds * messages
+    assert lag < MAX_LAG
@@ -0,0 +1,52 @@
+"""
+音声後処理の試験
+"""
+import pytest
+
+import main
+
+numpy = pytest.importorskip('numpy')
+
+RATE = 48000
+
+CHANNELS = 2
+
+
+@pytest.fixture(autouse=True)
+def numpy_loaded():
+    assert main.load_numpy()
+
+
+def tone(seconds: float, amplitude: int) -> numpy.ndarray:
+    """ 試験用音声生成
+
+    :param seconds: 長さ(秒)
+    :param amplitude: 振幅
+    :return: ステレオの正弦波のサンプル
+    """
+    t = numpy.arange(int(RATE * seconds)) / RATE
+    wave = (numpy.sin(2 * numpy.pi * 440 * t) * amplitude).astype('<i2')
+    return numpy.repeat(wave, CHANNELS)
+
+
+def test_limiter_only_attenuates_around_peaks():
+    pcm = numpy.concatenate([tone(0.5, 4000), tone(0.1, 20000), tone(0.5, 4000)])
+    processing = main.PostProcess(enabled=True, trim_threshold=-90.0, gains={'mn': 6.0}, limiter=True, ceiling=-1.0)
+
+    processed, _ = main.post_process(pcm.tobytes(), CHANNELS, RATE, 'mn', processing)
+    samples = numpy.frombuffer(processed, dtype='<i2')
+
+    ceiling = 32767 * 10 ** (-1.0 / 20)
+    assert numpy.abs(samples.astype(numpy.int32)).max() <= ceiling + 1
+    quiet = RATE * CHANNELS // 5
+    assert numpy.abs(samples[:quiet].astype(numpy.int32)).max() == pytest.approx(4000 * 10 ** (6.0 / 20), rel=0.01)
+    assert numpy.abs(samples[-quiet:].astype(numpy.int32)).max() == pytest.approx(4000 * 10 ** (6.0 / 20), rel=0.01)
+
+
+def test_limiter_disabled_keeps_gain():
+    pcm = tone(0.2, 20000)
+    processing = main.PostProcess(enabled=True, trim_threshold=-90.0, gains={'mn': 6.0}, limiter=False)
+
+    processed, _ = main.post_process(pcm.tobytes(), CHANNELS, RATE, 'mn', processing)
+
+    assert numpy.abs(numpy.frombuffer(processed, dtype='<i2').astype(numpy.int32)).max() >= 32767
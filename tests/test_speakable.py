@@ -0,0 +1,25 @@
+"""
+文字列可読化の試験
+"""
+import main
+
+
+def make_normalizer(chunk_length: int = 30) -> main.SpeakableNormalizer:
+    return main.SpeakableNormalizer(dict(main.SPEAKABLE_REPLACEMENTS), 100, chunk_length)
+
+
+def test_split_keeps_line_boundaries():
+    assert make_normalizer().split('a\nb\nc') == ['a、b、c']
+
+
+def test_split_joins_sentences_without_separator():
+    assert make_normalizer().split('おはよう。\n元気？\nまたね') == ['おはよう。元気？またね']
+
+
+def test_split_does_not_exceed_chunk_length():
+    assert make_normalizer(6).split('あいう\nえお\nかきくけこさしす') == ['あいう、えお', 'かきくけこさ', 'しす']
+    assert make_normalizer(5).split('あいう\nえお') == ['あいう', 'えお']
+
+
+def test_split_empty_lines():
+    assert make_normalizer().split('\n\n') == []